@@ -0,0 +1,195 @@
+# benchmark suite for the public model methods
+# usage: python -m benchmarks.bench --size 10k --out results.json [--compare old.json]
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+from lib import database_utils
+from lib.author import Author
+from lib.magazine import Magazine
+from lib.article import Article
+from lib.cache import result_cache
+from .datagen import PRESETS, generate
+
+# value at percentile p (0-100) of an already sorted list
+def _percentile(sorted_values,p):
+    index=min(len(sorted_values)-1, round(p/100*(len(sorted_values)-1)))
+    return sorted_values[index]
+
+# time fn(arg) for every arg, then rerun a few calls under tracemalloc for the peak memory
+# the result cache is off (every call does the work) unless warm, where every arg is cached before timing
+def _measure(fn,args,memory_calls=5,warm=False):
+    Author.identity_map.clear()
+    Magazine.identity_map.clear()
+    result_cache.clear()
+    maxsize=result_cache.maxsize
+    result_cache.maxsize=maxsize if warm else 0
+    timings=[]
+    # the model save() methods print a line per call, keep that out of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        if warm:
+            for arg in args:
+                fn(arg)
+        for arg in args:
+            start=time.perf_counter()
+            fn(arg)
+            timings.append(time.perf_counter()-start)
+        Author.identity_map.clear()
+        Magazine.identity_map.clear()
+        if not warm:
+            result_cache.clear()
+        tracemalloc.start()
+        for arg in args[:memory_calls]:
+            fn(arg)
+        peak=tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    result_cache.maxsize=maxsize
+    timings.sort()
+    total=sum(timings)
+    return {
+        'calls': len(timings),
+        'total_s': total,
+        'throughput_per_s': len(timings)/total if total else None,
+        'p50_ms': _percentile(timings,50)*1000,
+        'p99_ms': _percentile(timings,99)*1000,
+        'peak_mem_kb': peak/1024,
+    }
+
+# change a column first so the save really writes, an unchanged magazine is skipped by save()
+def _changed_save(magazine):
+    magazine.category='Bench' if magazine.category!='Bench' else 'Bench 2'
+    magazine.save()
+
+# every public method to benchmark, as name -> (function of one sample, sample kind)
+def _cases():
+    return {
+        'Author.find_by_id': (Author.find_by_id, 'author_id'),
+        'Magazine.find_by_id': (Magazine.find_by_id, 'magazine_id'),
+        'Article.find_by_id': (Article.find_by_id, 'article_id'),
+        'Author.articles': (lambda a: a.articles(), 'author'),
+        'Author.magazines': (lambda a: a.magazines(), 'author'),
+        'Author.topic_areas': (lambda a: a.topic_areas(), 'author'),
+        'Author.stats': (lambda a: a.stats(), 'author'),
+        'Magazine.articles': (lambda m: m.articles(), 'magazine'),
+        'Magazine.contributors': (lambda m: m.contributors(), 'magazine'),
+        'Magazine.contributing_authors': (lambda m: m.contributing_authors(), 'magazine'),
+        'Magazine.article_titles': (lambda m: m.article_titles(), 'magazine'),
+        # writes last so they do not change the data the reads above see
+        'Author.save': (lambda i: Author(f'Bench Author {i}').save(), 'counter'),
+        'Magazine.save': (_changed_save, 'magazine'),
+        # unchanged instance, dirty tracking turns this into a no-op
+        'Magazine.save (clean)': (lambda m: m.save(), 'magazine'),
+        'Article.save': (lambda a: Article(f'Bench {a.id}', a, Magazine.find_by_id(1)).save(), 'author'),
+    }
+
+# methods memoized in the result cache, also reported warm (served from the cache) as '<name> (warm)'
+CACHED=('Author.magazines', 'Author.topic_areas', 'Magazine.contributors', 'Magazine.article_titles')
+
+# seeded samples of each kind, heavy relationship methods get fewer calls
+def _samples(rng,calls,heavy_calls):
+    with database_utils.checkout() as conn:
+        count=lambda table: conn.execute(f'SELECT MAX(id) FROM {table}').fetchone()[0]
+        n_authors,n_magazines,n_articles=count('authors'),count('magazines'),count('articles')
+    return {
+        'author_id': [rng.randint(1,n_authors) for _ in range(calls)],
+        'magazine_id': [rng.randint(1,n_magazines) for _ in range(calls)],
+        'article_id': [rng.randint(1,n_articles) for _ in range(calls)],
+        'author': Author.find_by_ids([rng.randint(1,n_authors) for _ in range(heavy_calls)]),
+        'magazine': Magazine.find_by_ids([rng.randint(1,n_magazines) for _ in range(heavy_calls)]),
+        'counter': list(range(calls)),
+    }
+
+# git commit of the working tree, if available
+def _commit():
+    try:
+        return subprocess.run(['git','rev-parse','HEAD'],capture_output=True,text=True,check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(db_file,calls=200,heavy_calls=20,seed=0,only=None):
+    database_utils.DB_FILE=db_file
+    # a db generated by an older checkout may predate the latest migrations
+    database_utils.migrate()
+    rng=random.Random(seed)
+    samples=_samples(rng,calls,heavy_calls)
+    results={}
+    for name,(fn,kind) in _cases().items():
+        if only and name not in only:
+            continue
+        results[name]=_measure(fn,samples[kind])
+        if name in CACHED:
+            results[f'{name} (warm)']=_measure(fn,samples[kind],warm=True)
+    return results
+
+# print the ratio between two result files (above 1.0 means the new run is slower)
+def compare(old,new):
+    for name,result in new['results'].items():
+        before=old['results'].get(name)
+        if before:
+            print(f"{name:32} p50 x{result['p50_ms']/before['p50_ms']:.2f}  p99 x{result['p99_ms']/before['p99_ms']:.2f}")
+
+def main(argv=None):
+    parser=argparse.ArgumentParser(description='Benchmark the model methods on a synthetic dataset')
+    parser.add_argument('--size', choices=PRESETS, default='10k')
+    parser.add_argument('--articles', type=int, help='overrides --size')
+    parser.add_argument('--db', help='database file, generated if it does not exist yet')
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--heavy-calls', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', nargs='*', help='benchmark only these methods')
+    parser.add_argument('--out', help='write the results as json to this file')
+    parser.add_argument('--compare', help='earlier results json to compare against')
+    args=parser.parse_args(argv)
+
+    n_articles=args.articles or PRESETS[args.size]
+    db_file=args.db or os.path.join(tempfile.gettempdir(), f'bench_{n_articles}_{args.seed}.db')
+    dataset=None
+    if not os.path.exists(db_file):
+        print(f'generating {n_articles:,} articles into {db_file}')
+        dataset=generate(db_file, n_articles, seed=args.seed, progress=True)
+
+    # writes go to a scratch copy so the generated db can be reused by the next run
+    scratch=db_file+'.run'
+    with sqlite3.connect(db_file) as source, sqlite3.connect(scratch) as target:
+        source.backup(target)
+    try:
+        results=run(scratch, args.calls, args.heavy_calls, args.seed, args.only)
+    finally:
+        database_utils.close_connections()
+        for suffix in ('','-wal','-shm'):
+            if os.path.exists(scratch+suffix):
+                os.remove(scratch+suffix)
+
+    report={
+        'meta': {
+            'commit': _commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'articles': n_articles,
+            'seed': args.seed,
+            'dataset': dataset,
+        },
+        'results': results,
+    }
+    for name,result in results.items():
+        print(f"{name:32} {result['throughput_per_s']:>10,.0f}/s  p50 {result['p50_ms']:8.3f}ms  "
+              f"p99 {result['p99_ms']:8.3f}ms  peak {result['peak_mem_kb']:9.1f}KB")
+    if args.out:
+        with open(args.out,'w') as f:
+            json.dump(report,f,indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f),report)
+
+if __name__=='__main__':
+    main()
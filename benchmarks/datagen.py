@@ -0,0 +1,71 @@
+# seeded synthetic data generator for benchmarks
+# article counts per author and per magazine follow a zipf-like skew, like real publications
+import argparse
+import bisect
+import itertools
+import random
+import time
+
+from lib import database_utils
+from lib.author import Author
+from lib.magazine import Magazine
+from lib.article import Article
+
+CATEGORIES=['Technology','Science','Fashion','Sports','Politics','Health',
+            'Travel','Food','Business','Art','Music','Education']
+
+# dataset presets by name
+PRESETS={'10k': 10_000, '1m': 1_000_000, '10m': 10_000_000}
+
+# cumulative zipf weights for n ranks (rank 1 is the most popular)
+def _zipf_cum_weights(n,skew):
+    return list(itertools.accumulate(1/(rank**skew) for rank in range(1,n+1)))
+
+# pick an index 0..n-1 from cumulative weights
+def _pick(rng,cum_weights):
+    return bisect.bisect(cum_weights, rng.random()*cum_weights[-1])
+
+# build a database with n_articles articles, defaults scale authors/magazines with the article count
+def generate(db_file,n_articles,n_authors=None,n_magazines=None,seed=0,skew=1.1,progress=False):
+    n_authors=n_authors or max(n_articles//20,10)
+    n_magazines=n_magazines or max(n_articles//1000,5)
+    rng=random.Random(seed)
+
+    database_utils.DB_FILE=db_file
+    database_utils.migrate()
+    start=time.perf_counter()
+
+    author_ids=Author.save_many((f'Author {i}',) for i in range(n_authors))
+    magazine_ids=Magazine.save_many(
+        (f'Magazine {i}', CATEGORIES[rng.randrange(len(CATEGORIES))]) for i in range(n_magazines))
+
+    # shuffle which ids are popular so popularity is not correlated with insertion order
+    rng.shuffle(author_ids)
+    rng.shuffle(magazine_ids)
+    author_weights=_zipf_cum_weights(n_authors,skew)
+    magazine_weights=_zipf_cum_weights(n_magazines,skew)
+
+    def rows():
+        for i in range(n_articles):
+            if progress and i and i%1_000_000==0:
+                print(f'  {i:,} articles ({i/(time.perf_counter()-start):,.0f} rows/s)')
+            yield (f'Article {i}',
+                   author_ids[_pick(rng,author_weights)],
+                   magazine_ids[_pick(rng,magazine_weights)])
+
+    Article.bulk_create(rows())
+    return {'authors': n_authors, 'magazines': n_magazines, 'articles': n_articles,
+            'seed': seed, 'skew': skew, 'seconds': time.perf_counter()-start}
+
+def main(argv=None):
+    parser=argparse.ArgumentParser(description='Generate a synthetic magazine database')
+    parser.add_argument('db_file')
+    parser.add_argument('--size', choices=PRESETS, default='10k')
+    parser.add_argument('--articles', type=int, help='overrides --size')
+    parser.add_argument('--seed', type=int, default=0)
+    args=parser.parse_args(argv)
+    info=generate(args.db_file, args.articles or PRESETS[args.size], seed=args.seed, progress=True)
+    print(f"generated {info['articles']:,} articles in {info['seconds']:.1f}s")
+
+if __name__=='__main__':
+    main()
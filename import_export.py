@@ -0,0 +1,32 @@
+# command line entry point for streaming imports and exports
+# python import_export.py import authors authors.csv
+# python import_export.py export articles articles.jsonl --db magazine.db
+import argparse
+
+from lib import database_utils
+from lib.transfer import EXPORTS, import_file, export_file
+
+def main(argv=None):
+    parser=argparse.ArgumentParser(description='Import or export magazine data as csv or jsonl')
+    parser.add_argument('--db', default=database_utils.DB_FILE, help='database file (default: %(default)s)')
+    parser.add_argument('--format', choices=['csv','jsonl'], help='file format (default: from the extension)')
+    commands=parser.add_subparsers(dest='command', required=True)
+    importer=commands.add_parser('import', help='load a file into the database')
+    importer.add_argument('kind', choices=['authors','magazines','articles'])
+    importer.add_argument('path')
+    importer.add_argument('--chunk-size', type=int, default=database_utils.BULK_CHUNK_SIZE,
+                          help='rows per transaction')
+    exporter=commands.add_parser('export', help='write a table or relationship to a file')
+    exporter.add_argument('kind', choices=list(EXPORTS))
+    exporter.add_argument('path')
+    args=parser.parse_args(argv)
+
+    database_utils.DB_FILE=args.db
+    database_utils.migrate()
+    if args.command=='import':
+        import_file(args.kind, args.path, args.format, args.chunk_size)
+    else:
+        export_file(args.kind, args.path, args.format)
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,39 @@
+# asyncio support: runs the blocking sqlite calls on a small dedicated thread pool
+import asyncio
+import atexit
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# number of db worker threads, each keeps its own pooled connection (connection affinity)
+DB_EXECUTOR_WORKERS=4
+
+_executor=None
+_executor_lock=threading.Lock()
+
+# the shared db executor, created on first use
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor=ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix='db')
+    return _executor
+
+# await a blocking model call without stalling the event loop
+async def run_in_db(func,*args,**kwargs):
+    loop=asyncio.get_running_loop()
+    # run in a copy of the caller's context so capture() blocks of the calling task see the queries
+    context=contextvars.copy_context()
+    return await loop.run_in_executor(get_executor(), functools.partial(context.run,func,*args,**kwargs))
+
+# wait for queued calls and stop the worker threads (a new executor is created on next use)
+def shutdown_executor():
+    global _executor
+    with _executor_lock:
+        executor,_executor=_executor,None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+atexit.register(shutdown_executor)
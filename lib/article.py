@@ -1,15 +1,33 @@
-from .database_utils import get_connection
+from collections import namedtuple
+
+from .database_utils import get_connection, checkout, chunked, bulk_write, track_instances, rows_by_ids, iter_rows, BULK_CHUNK_SIZE, FETCH_BATCH_SIZE
+from .aio import run_in_db
+from .writer import write
 from .author import Author
 from .magazine import Magazine
 
+# one page of a keyset paginated article list
+# next_after_id is the after_id for the following page, or None on the last page
+Page=namedtuple('Page', ['articles', 'next_after_id'])
+
+# plain article row for the rows only mode, no author/magazine objects are built
+ArticleRow=namedtuple('ArticleRow', ['id', 'title', 'author_id', 'magazine_id'])
+
 # initialize new article instance
 class Article:
+    # fixed attribute slots instead of a per-instance __dict__ to keep instances small
+    __slots__=('_id','_title','_author','_magazine','_author_id','_magazine_id','_dirty')
+
     def __init__(self,title,author,magazine,id=None):
         self._id=id #store the db ID
         self._title=None # initialize _title as none
         self.title=title # use the setter to set the title
         self._author=author # store the author instance
         self._magazine=magazine # store the magazine instance
+        self._author_id=None # ids are only used for lazily loaded articles
+        self._magazine_id=None
+        # columns changed since the article was loaded or last saved (None when there are none)
+        self._dirty={'title','author_id','magazine_id'}
 
     # getter for articles id (read-only)
     @property
@@ -35,16 +53,31 @@ class Article:
         self._title=value
 
     # getter for article's author (read-only)
+    # articles loaded without eager=True only hold the author id, the author is loaded on first access
     @property
     def author(self):
+        if self._author is None and self._author_id is not None:
+            # goes through the identity map, so shared authors are loaded once
+            self._author=Author.find_by_id(self._author_id)
         return self._author
-    # getter for article's magazine (read-only)
+    # getter for article's magazine (read-only), loaded on first access like the author
     @property
     def magazine(self):
+        if self._magazine is None and self._magazine_id is not None:
+            self._magazine=Magazine.find_by_id(self._magazine_id)
         return self._magazine
 
+    # foreign key ids, available without loading the author/magazine
+    @property
+    def author_id(self):
+        return self._author.id if self._author is not None else self._author_id
+    @property
+    def magazine_id(self):
+        return self._magazine.id if self._magazine is not None else self._magazine_id
+
 
-    # class method to create an article
+    # class method to create an article from an (id, title, author_id, magazine_id) row
+    # the author and magazine are not fetched until they are accessed
     @classmethod
     def new_from_db(cls,row):
         # check if row has been returned
@@ -56,49 +89,263 @@ class Article:
         author_id=row[2]
         magazine_id=row[3]
 
-        # fetch the author and magazine object using their ids
+        #create and return new article instance (the row is trusted, so no validation)
+        return cls._trusted(article_id, title, author_id, magazine_id)
 
-        author= Author.find_by_id(author_id)
-        magazine=Magazine.find_by_id(magazine_id)
+    # build an article from values read from the db, skipping the setter validation
+    # author and magazine are the instances when already known, otherwise they are loaded lazily
+    @classmethod
+    def _trusted(cls,id,title,author_id,magazine_id,author=None,magazine=None):
+        article=cls.__new__(cls)
+        article._id=id
+        article._title=title
+        article._author_id=author_id
+        article._magazine_id=magazine_id
+        article._author=author
+        article._magazine=magazine
+        article._dirty=None
+        return article
 
-        #create and return new article instance
-        return cls(title=title, author=author, magazine=magazine, id=article_id)
+    # class method to create articles from rows of the joined article/author/magazine query
+    # authors and magazines are dicts of id -> instance so repeated ids share one object
+    @classmethod
+    def new_from_joined_rows(cls,rows,authors=None,magazines=None):
+        authors={} if authors is None else authors
+        magazines={} if magazines is None else magazines
+        articles=[]
+        for article_id,title,author_id,magazine_id,author_name,magazine_name,category in rows:
+            # build the author only the first time its id shows up
+            # (new_from_db goes through the identity map)
+            author=authors.get(author_id)
+            if author is None and author_name is not None:
+                author=authors[author_id]=Author.new_from_db((author_id, author_name))
+            # same for the magazine
+            magazine=magazines.get(magazine_id)
+            if magazine is None and magazine_name is not None:
+                magazine=magazines[magazine_id]=Magazine.new_from_db((magazine_id, magazine_name, category))
+            articles.append(cls._trusted(article_id, title, author_id, magazine_id, author, magazine))
+        return articles
 
-    #class method to find an article by their id
+    # class method to create lazy articles from (id, title, author_id, magazine_id) rows
+    # authors and magazines already known to the caller are attached, the rest load on access
     @classmethod
-    def find_by_id(cls,id):
+    def new_from_lazy_rows(cls,rows,authors=None,magazines=None):
+        authors=authors or {}
+        magazines=magazines or {}
+        return [cls._trusted(article_id, title, author_id, magazine_id,
+                             authors.get(author_id), magazines.get(magazine_id))
+                for article_id,title,author_id,magazine_id in rows]
+
+    # class method returning ArticleRow tuples for the where clause, in id order
+    @classmethod
+    def find_rows(cls,where,params=()):
+        with checkout() as conn:
+            rows=conn.execute(cls._select_sql(where), params).fetchall()
+        return list(map(ArticleRow._make, rows))
+
+    # streaming version of find_rows
+    @classmethod
+    def iter_rows(cls,where,params=(),batch_size=FETCH_BATCH_SIZE):
+        return map(ArticleRow._make, iter_rows(cls._select_sql(where), params, batch_size))
+
+    # sql for articles (aliased ar) filtered by the given where clause
+    # eager also selects the author and magazine columns, with left joins so an article
+    # with a missing author/magazine still comes back (with None)
+    @staticmethod
+    def _select_sql(where,eager=False,limit=None):
+        if eager:
+            sql=f'''
+            SELECT ar.id, ar.title, ar.author_id, ar.magazine_id,
+                   au.name, m.name, m.category
+            FROM articles ar
+            LEFT JOIN authors au ON au.id = ar.author_id
+            LEFT JOIN magazines m ON m.id = ar.magazine_id
+            WHERE {where}
+            ORDER BY ar.id
+        '''
+        else:
+            sql=f'''
+            SELECT ar.id, ar.title, ar.author_id, ar.magazine_id
+            FROM articles ar
+            WHERE {where}
+            ORDER BY ar.id
+        '''
+        return sql if limit is None else f"{sql} LIMIT {int(limit)}"
+
+    # build articles from rows of _select_sql
+    @classmethod
+    def _hydrate(cls,rows,eager,authors=None,magazines=None):
+        if eager:
+            return cls.new_from_joined_rows(rows, authors, magazines)
+        return cls.new_from_lazy_rows(rows, authors, magazines)
+
+    # class method to load the articles matching the where clause in a single query
+    # eager=True loads their authors and magazines in the same (joined) query,
+    # otherwise those are loaded on first access
+    @classmethod
+    def find_where(cls,where,params=(),eager=False,authors=None,magazines=None):
+        with checkout() as conn:
+            cursor=conn.cursor()
+            cursor.execute(cls._select_sql(where, eager), params)
+            rows=cursor.fetchall()
+        return cls._hydrate(rows, eager, authors, magazines)
+
+    # class method to fetch one keyset page of articles owned by column (author_id or magazine_id)
+    # seeking on articles.id means a deep page costs the same as the first one, unlike OFFSET
+    # rows_only fills the page with ArticleRow tuples instead of Article objects
+    @classmethod
+    def find_page(cls,column,owner_id,limit,after_id=None,eager=False,authors=None,magazines=None,rows_only=False):
+        # a page must hold at least one article, otherwise there is no cursor for the next page
+        if limit<1:
+            raise ValueError('Page limit must be at least 1')
+        with checkout() as conn:
+            cursor=conn.cursor()
+            # ask for one extra row to know whether there is another page
+            cursor.execute(cls._select_sql(f"ar.{column}=? AND ar.id>?", eager and not rows_only, limit+1), (owner_id, after_id or 0))
+            rows=cursor.fetchall()
+        if rows_only:
+            articles=list(map(ArticleRow._make, rows[:limit]))
+        else:
+            articles=cls._hydrate(rows[:limit], eager, authors, magazines)
+        next_after_id=articles[-1].id if len(rows)>limit else None
+        return Page(articles, next_after_id)
+
+    # generator version of find_where that streams rows with fetchmany and builds articles lazily
+    # only one batch of rows is held in memory at a time
+    @classmethod
+    def iter_where(cls,where,params=(),batch_size=FETCH_BATCH_SIZE,eager=False,authors=None,magazines=None):
         conn=get_connection()
         cursor=conn.cursor()
-        # execute a select query to find the article by id
-        cursor.execute("SELECT * FROM articles WHERE id=?", (id,))
-        # fetch the first row from the result that matches
-        row = cursor.fetchone()
-        # close the connection
-        conn.close()
-        # create and return an article instance from the row
-        return cls.new_from_db(row)
+        try:
+            cursor.execute(cls._select_sql(where, eager), params)
+            while True:
+                rows=cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                # fresh lookup dicts per batch (seeded with the given ones) so nothing grows with the result size
+                yield from cls._hydrate(rows, eager, dict(authors or {}), dict(magazines or {}))
+        finally:
+            cursor.close()
+            conn.close()
+
+    #class method to find an article by their id
+    @classmethod
+    def find_by_id(cls,id):
+        # one joined query instead of one query each for the article, author and magazine
+        articles=cls.find_where("ar.id=?", (id,), eager=True)
+        # return the article or None if no row matched
+        return articles[0] if articles else None
+
+    # class method to find many articles at once, returned in input order (None for unknown ids)
+    # uses chunked IN (...) queries joined with authors and magazines
+    @classmethod
+    def find_by_ids(cls,ids):
+        ids=list(ids)
+        rows=rows_by_ids(cls._select_sql("ar.id IN ({ids})", eager=True), ids)
+        found={article.id: article for article in cls.new_from_joined_rows(rows.values())}
+        return [found.get(id) for id in ids]
+
+    # class method for ranked full text search over article titles (best match first)
+    # magazine and author narrow the search and can be instances or ids
+    # the query's words must all match, raw=True passes the query through as fts5 syntax instead
+    @classmethod
+    def search(cls,query,magazine=None,author=None,limit=20,raw=False):
+        if not raw:
+            # quote every word so characters like - or + are not read as fts5 operators
+            query=' '.join('"{}"'.format(word.replace('"','""')) for word in query.split())
+        if not query:
+            return []
+        where=["articles_fts MATCH ?"]
+        params=[query]
+        if magazine is not None:
+            where.append("ar.magazine_id=?")
+            params.append(getattr(magazine,'id',magazine))
+        if author is not None:
+            where.append("ar.author_id=?")
+            params.append(getattr(author,'id',author))
+        params.append(limit)
+        with checkout() as conn:
+            rows=conn.execute(f'''
+                SELECT ar.id, ar.title, ar.author_id, ar.magazine_id,
+                       au.name, m.name, m.category
+                FROM articles_fts
+                JOIN articles ar ON ar.id = articles_fts.rowid
+                LEFT JOIN authors au ON au.id = ar.author_id
+                LEFT JOIN magazines m ON m.id = ar.magazine_id
+                WHERE {' AND '.join(where)}
+                ORDER BY articles_fts.rank
+                LIMIT ?
+            ''', params).fetchall()
+        return cls.new_from_joined_rows(rows)
 
     # instance method to save the article to the db
     def save(self):
-        conn=get_connection()
-        cursor=conn.cursor()
+        # nothing changed since the article was loaded or last saved, so there is nothing to write
+        if self._id is not None and not self._dirty:
+            return
+        # so a rolled back session() can put the id and changed columns back
+        track_instances((self,))
         #check if the article already exists in the db
+        # write() commits it and invalidates cached results computed from the articles table
+        # (through the single writer thread when the write queue is enabled, see lib/writer.py)
         if self._id is None:
-            #insert article into the db since it does not exist
-            cursor.execute("INSERT INTO articles (title, author_id, magazine_id) VALUES (?,?,?)", 
-                         (self._title, self._author.id, self._magazine.id))
-            #get the id of the newly inserted article
-            self._id=cursor.lastrowid
+            #insert article into the db since it does not exist and get the id of the newly inserted article
+            self._id=write('articles', "INSERT INTO articles (title, author_id, magazine_id) VALUES (?,?,?)",
+                         (self._title, self.author_id, self.magazine_id))
             print(f'created new article with ID: {self._id}')
         else:
-            #article exists and needs to be updated
-            cursor.execute("UPDATE articles SET title=?, author_id=?, magazine_id=? WHERE id=?",
-            (self._title, self._author.id, self._magazine.id, self._id))
+            #article exists and needs to be updated, only the changed columns are written
+            values={'title': self._title, 'author_id': self.author_id, 'magazine_id': self.magazine_id}
+            columns=[column for column in values if column in self._dirty]
+            write('articles', f"UPDATE articles SET {', '.join(f'{column}=?' for column in columns)} WHERE id=?",
+            [values[column] for column in columns]+[self._id])
             print(f'updated article with ID: {self._id}')
-        #save the changes and close the connection
-        conn.commit()
-        conn.close()
+        self._dirty=None
+
+    # class method to insert many articles at once in chunked transactions
+    # accepts Article instances or plain (title, author_id, magazine_id) tuples and returns the ids in input order
+    @classmethod
+    def bulk_create(cls,articles,chunk_size=BULK_CHUNK_SIZE):
+        ids=[]
+        for chunk in chunked(articles,chunk_size):
+            # tuples and unsaved instances are inserted, saved instances are updated if they changed
+            inserts=[a for a in chunk if not isinstance(a,cls) or a._id is None]
+            updates=[a for a in chunk if isinstance(a,cls) and a._id is not None and a._dirty]
+            new_ids=iter(bulk_write('articles',
+                "INSERT INTO articles (title, author_id, magazine_id) VALUES (?,?,?)",
+                [(a._title, a.author_id, a.magazine_id) if isinstance(a,cls) else tuple(a) for a in inserts],
+                "UPDATE articles SET title=?, author_id=?, magazine_id=? WHERE id=?",
+                [(a._title, a.author_id, a.magazine_id, a._id) for a in updates]))
+            track_instances([a for a in chunk if isinstance(a,cls)])
+            # give the new ids back to the instances
+            for article in chunk:
+                if not isinstance(article,cls):
+                    ids.append(next(new_ids))
+                    continue
+                if article._id is None:
+                    article._id=next(new_ids)
+                article._dirty=None
+                ids.append(article._id)
+        return ids
+
+    # async versions of the methods above for asyncio code, run on the db executor (lib/aio.py)
+    @classmethod
+    async def afind_by_id(cls,id):
+        return await run_in_db(cls.find_by_id,id)
+
+    @classmethod
+    async def afind_by_ids(cls,ids):
+        return await run_in_db(cls.find_by_ids,list(ids))
+
+    @classmethod
+    async def abulk_create(cls,articles,*args,**kwargs):
+        return await run_in_db(cls.bulk_create,list(articles),*args,**kwargs)
+
+    async def asave(self):
+        return await run_in_db(self.save)
 
     #string rep of the article for easy debugging
     def __repr__(self):
-        return f'<Article id={self._id} title={self._title} author={self._author.name} magazine={self._magazine.name}>'
\ No newline at end of file
+        author=self.author
+        magazine=self.magazine
+        return f'<Article id={self._id} title={self._title} author={author.name if author else None} magazine={magazine.name if magazine else None}>'
\ No newline at end of file
@@ -1,12 +1,23 @@
-from .database_utils import get_connection
+from .database_utils import checkout, chunked, bulk_write, track_instances, rows_by_ids, BULK_CHUNK_SIZE, FETCH_BATCH_SIZE
+from .cache import IdentityMap, cached_result
+from .aio import run_in_db
+from .writer import write
 
 class Author:
+# fixed attribute slots instead of a per-instance __dict__ to keep instances small
+    __slots__=('_id','_name','_dirty')
+
+# identity map so the same author id always gives back the same instance
+    identity_map=IdentityMap(maxsize=1024)
+
 # initialize a new author instance
     def __init__(self,name,id=None):
 # store the db ID (none for new authors)
         self._id=id
 # initialize _name as none
         self._name=None
+# columns changed since the author was loaded or last saved (None when there are none)
+        self._dirty=None
 # use the setter to set the name (with validation)
         self.name=name
 
@@ -36,6 +47,7 @@ class Author:
             raise ValueError('Authors name must be longer than 0 characters')
 # store the name when all the validation checks pass
         self._name=value
+        self._dirty={'name'}
 
 # class method to create an author instance from a db row
     @classmethod
@@ -44,77 +56,152 @@ class Author:
         if row is None:
             return None # return None if no row was found
 
-# create and return a new author instance
-        return cls(name=row[1], id=row[0])
+# reuse the cached instance for this id if there is one
+        author=cls.identity_map.get(row[0])
+        if author is None:
+            author=cls._from_row(row)
+        return author
+
+# create an author from a trusted db row and register it in the identity map
+    @classmethod
+    def _from_row(cls,row):
+        return cls.identity_map.setdefault(row[0], cls._trusted(row[0], row[1]))
+
+# build an author from values read from the db, skipping the setter validation
+    @classmethod
+    def _trusted(cls,id,name):
+        author=cls.__new__(cls)
+        author._id=id
+        author._name=name
+        author._dirty=None
+        return author
 
 # class method to find an author by id
     @classmethod
     def find_by_id(cls,id):
-# connect to the db
-        conn=get_connection()
+# return the cached instance without touching the db when possible
+        author=cls.identity_map.get(id)
+        if author is not None:
+            return author
+# connect to the db (the connection is given back when the block ends)
+        with checkout() as conn:
 # cursor to execute the query
-        cursor=conn.cursor()
+            cursor=conn.cursor()
 # execute a select query to find the author by id
-        cursor.execute("SELECT * FROM authors WHERE id=?",(id,))
+            cursor.execute("SELECT * FROM authors WHERE id=?",(id,))
 # fetch the first row from the result that matches
-        row=cursor.fetchone()
-# close the connection
-        conn.close()
+            row=cursor.fetchone()
 # create and return an author instance from the row
-        return cls.new_from_db(row)
+        if row is None:
+            return None
+        return cls._from_row(row)
+
+# class method to find many authors at once, returned in input order (None for unknown ids)
+# only ids missing from the identity map are queried, in chunked IN (...) queries
+    @classmethod
+    def find_by_ids(cls,ids):
+        ids=list(ids)
+        found={}
+        misses=[]
+        for id in dict.fromkeys(ids):
+            author=cls.identity_map.get(id)
+            if author is None:
+                misses.append(id)
+            else:
+                found[id]=author
+        for id,row in rows_by_ids("SELECT * FROM authors WHERE id IN ({ids})", misses).items():
+            found[id]=cls._from_row(row)
+        return [found.get(id) for id in ids]
 
 # instance method to save the author to the db
     def save(self):
-# connection to the db
-        conn=get_connection()
-# cursor to execute the sql
-        cursor=conn.cursor()
+# nothing changed since the author was loaded or last saved, so there is nothing to write
+        if self._id is not None and not self._dirty:
+            type(self).identity_map.put(self._id, self)
+            return
+# so a rolled back session() can put the id and changed columns back
+        track_instances((self,))
 # check whether the author already has an id or not
+# write() commits it and invalidates cached results computed from the authors table
+# (through the single writer thread when the write queue is enabled, see lib/writer.py)
         if self._id is None:
-# means the author is new and needs to be inserted
-            cursor.execute("INSERT INTO authors (name) VALUES (?)",
+# means the author is new and needs to be inserted, and we get the id of the newly inserted author
+            self._id=write('authors',"INSERT INTO authors (name) VALUES (?)",
             (self._name,))
-# get the id of the newly inserted author
-            self._id=cursor.lastrowid
             print(f'created new author with ID: {self._id}')
         else:
 # author exists and needs to be updated
-            cursor.execute(
+            write('authors',
                 "UPDATE authors SET name= ? WHERE id=?",
                 (self._name,self._id)
             )
             print(f'updated author ID: {self._id}')
+        self._dirty=None
+# this instance is now the cached one for its id
+        type(self).identity_map.put(self._id, self)
 
-# commit the changes and close the connection
-        conn.commit()
-        conn.close()
+# class method to save many authors at once in chunked transactions
+# accepts Author instances or plain (name,) tuples and returns the ids in input order
+    @classmethod
+    def save_many(cls,authors,chunk_size=BULK_CHUNK_SIZE):
+        ids=[]
+        for chunk in chunked(authors,chunk_size):
+# tuples and unsaved instances are inserted, saved instances are updated if they changed
+            inserts=[a for a in chunk if not isinstance(a,cls) or a._id is None]
+            updates=[a for a in chunk if isinstance(a,cls) and a._id is not None and a._dirty]
+            new_ids=iter(bulk_write('authors',
+                "INSERT INTO authors (name) VALUES (?)",
+                [(a._name,) if isinstance(a,cls) else tuple(a) for a in inserts],
+                "UPDATE authors SET name=? WHERE id=?",
+                [(a._name,a._id) for a in updates]))
+            track_instances([a for a in chunk if isinstance(a,cls)])
+# give the new ids back to the instances and cache them
+            for author in chunk:
+                if not isinstance(author,cls):
+                    ids.append(next(new_ids))
+                    continue
+                if author._id is None:
+                    author._id=next(new_ids)
+                author._dirty=None
+                cls.identity_map.put(author._id,author)
+                ids.append(author._id)
+        return ids
 
 # the relationship method to get all the articles by this author
-    def articles(self):
-        conn=get_connection()
-        cursor=conn.cursor()
+# with a limit it returns a keyset Page of at most limit articles after the after_id cursor instead
+# rows_only returns lightweight ArticleRow tuples instead of Article objects (also in a Page)
+# the magazines are loaded on first access unless eager=True loads them in the same query
+    def articles(self,limit=None,after_id=None,rows_only=False,eager=False):
+        from .article import Article
+        if limit is not None:
+            return Article.find_page("author_id", self._id, limit, after_id, eager, authors={self._id: self}, rows_only=rows_only)
+        if rows_only:
+            return Article.find_rows("author_id=?", (self._id,))
 # find all articles where the author id matches this author id
-        cursor.execute("SELECT * FROM articles WHERE author_id=?", (self._id,))
-        rows=cursor.fetchall() # get all matching rows
-        conn.close()
+# this author instance is reused for every article instead of being looked up per row
+        return Article.find_where("ar.author_id=?", (self._id,), eager, authors={self._id: self})
 
-# convert rows to article objects and return them
+# streaming version of articles() that yields articles batch_size rows at a time
+    def iter_articles(self,batch_size=FETCH_BATCH_SIZE,rows_only=False,eager=False):
         from .article import Article
-        return [Article.new_from_db(row) for row in rows]
+        if rows_only:
+            return Article.iter_rows("author_id=?", (self._id,), batch_size)
+        return Article.iter_where("ar.author_id=?", (self._id,), batch_size, eager, authors={self._id: self})
 
     # relationship method to get all the magazines this author has written for
+    # (memoized until an article or magazine is written)
+    @cached_result('articles','magazines')
     def magazines(self):
-        conn=get_connection()
-        cursor=conn.cursor()
-        # usage of join to get all magazines that have articles by this author and DISTINCT to remove duplicates
-        cursor.execute('''
-            SELECT DISTINCT m.* FROM magazines m
-            JOIN articles a ON m.id = a.magazine_id
-            WHERE a.author_id=?
-        ''', (self._id,))
-        # fetch all matching rows
-        rows=cursor.fetchall()
-        conn.close()
+        with checkout() as conn:
+            cursor=conn.cursor()
+            # author_magazine_counts has one row per magazine this author has written for, so no DISTINCT needed
+            cursor.execute('''
+                SELECT m.* FROM author_magazine_counts c
+                JOIN magazines m ON m.id = c.magazine_id
+                WHERE c.author_id=?
+            ''', (self._id,))
+            # fetch all matching rows
+            rows=cursor.fetchall()
         # convert rows to magazine objects and return them
         from .magazine import Magazine
         return [Magazine.new_from_db(row) for row in rows]
@@ -130,16 +217,68 @@ class Author:
         return new_article
     
     # method to get unique categories of magazines this author has written for
+    @cached_result('articles','magazines')
     def topic_areas(self):
-        # get all magazines this author has written for
-        author_magazines = self.magazines()
-        # extract unique categories from the magazines
-        categories = []
-        for magazine in author_magazines:
-            if magazine.category not in categories:
-                categories.append(magazine.category)
+        with checkout() as conn:
+            # let sqlite dedupe the categories instead of loading every magazine
+            rows=conn.execute('''
+                SELECT DISTINCT m.category FROM magazines m
+                JOIN articles a ON m.id = a.magazine_id
+                WHERE a.author_id=?
+            ''', (self._id,)).fetchall()
         # return list of unique categories
-        return categories
+        return [row[0] for row in rows]
+
+    # article count, magazine count, articles per category and first/last article id in one query
+    def stats(self):
+        with checkout() as conn:
+            # one row per category, a magazine has a single category so the per category counts add up
+            rows=conn.execute('''
+                SELECT m.category, COUNT(*), COUNT(DISTINCT a.magazine_id), MIN(a.id), MAX(a.id)
+                FROM articles a
+                LEFT JOIN magazines m ON m.id = a.magazine_id
+                WHERE a.author_id=?
+                GROUP BY m.category
+            ''', (self._id,)).fetchall()
+        return {
+            'article_count': sum(row[1] for row in rows),
+            'magazine_count': sum(row[2] for row in rows),
+            'categories': {row[0]: row[1] for row in rows},
+            'first_article_id': min((row[3] for row in rows), default=None),
+            'last_article_id': max((row[4] for row in rows), default=None),
+        }
+
+# async versions of the methods above for asyncio code, run on the db executor (lib/aio.py)
+    @classmethod
+    async def afind_by_id(cls,id):
+        return await run_in_db(cls.find_by_id,id)
+
+    @classmethod
+    async def afind_by_ids(cls,ids):
+        return await run_in_db(cls.find_by_ids,list(ids))
+
+    @classmethod
+    async def asave_many(cls,authors,*args,**kwargs):
+        return await run_in_db(cls.save_many,list(authors),*args,**kwargs)
+
+    async def asave(self):
+        return await run_in_db(self.save)
+
+    async def aarticles(self,*args,**kwargs):
+        return await run_in_db(self.articles,*args,**kwargs)
+
+    async def amagazines(self):
+        return await run_in_db(self.magazines)
+
+    async def aadd_article(self,title,magazine):
+        return await run_in_db(self.add_article,title,magazine)
+
+    async def atopic_areas(self):
+        return await run_in_db(self.topic_areas)
+
+    async def astats(self):
+        return await run_in_db(self.stats)
+
 # string rep of the author for debugging and printing
     def __repr__(self):
         return f'<Author id={self._id} name={self._name}>'
\ No newline at end of file
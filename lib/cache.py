@@ -0,0 +1,223 @@
+# in-memory caches used by the model classes
+import functools
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+from . import database_utils
+
+# identity map with an LRU size bound: one instance per primary key per database file
+class IdentityMap:
+    # every identity map created, so they can all be emptied when the db is replaced
+    instances=weakref.WeakSet()
+
+    def __init__(self,maxsize=1024):
+        # maximum number of cached instances (0 disables caching)
+        self.maxsize=maxsize
+        # entries ordered from least to most recently used
+        self._entries=OrderedDict()
+        self._lock=threading.Lock()
+        # counters used to size the cache in production
+        self.hits=0
+        self.misses=0
+        self.evictions=0
+        IdentityMap.instances.add(self)
+
+    # entries are keyed on the db file as well, so switching databases never returns a stale object
+    def _key(self,id):
+        return (database_utils.DB_FILE, id)
+
+    # return the cached instance for this id (or None) and count the hit or miss
+    def get(self,id):
+        key=self._key(id)
+        with self._lock:
+            obj=self._entries.get(key)
+            if obj is None:
+                self.misses+=1
+                return None
+            # mark the entry as most recently used
+            self._entries.move_to_end(key)
+            self.hits+=1
+            return obj
+
+    # store obj for this id, replacing whatever was cached before
+    def put(self,id,obj):
+        if self.maxsize<=0:
+            return obj
+        key=self._key(id)
+        with self._lock:
+            self._entries[key]=obj
+            self._entries.move_to_end(key)
+            self._evict()
+        return obj
+
+    # store obj only if nothing is cached for this id yet, and return the cached instance
+    def setdefault(self,id,obj):
+        if self.maxsize<=0:
+            return obj
+        key=self._key(id)
+        with self._lock:
+            cached=self._entries.get(key)
+            if cached is not None:
+                return cached
+            self._entries[key]=obj
+            self._evict()
+        return obj
+
+    # drop the cached instance for this id
+    def discard(self,id):
+        with self._lock:
+            self._entries.pop(self._key(id), None)
+
+    # drop every cached instance and reset the counters
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits=self.misses=self.evictions=0
+
+    # drop the cached instances of every identity map (the counters are kept)
+    @classmethod
+    def clear_all(cls):
+        for identity_map in cls.instances:
+            with identity_map._lock:
+                identity_map._entries.clear()
+
+    # change the size bound, evicting the least recently used entries if needed
+    def resize(self,maxsize):
+        with self._lock:
+            self.maxsize=maxsize
+            self._evict()
+
+    # remove least recently used entries until the cache fits (caller holds the lock)
+    def _evict(self):
+        while len(self._entries)>max(self.maxsize,0):
+            self._entries.popitem(last=False)
+            self.evictions+=1
+
+    # snapshot of the counters
+    def stats(self):
+        lookups=self.hits+self.misses
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits/lookups if lookups else 0.0,
+        }
+
+    def __len__(self):
+        return len(self._entries)
+
+# memoized relationship results, LRU bounded with an optional ttl in seconds
+# an entry is only served while the generations of the tables it was computed from are unchanged
+class ResultCache:
+    def __init__(self,maxsize=4096,ttl=None):
+        # maximum number of cached results (0 disables caching)
+        self.maxsize=maxsize
+        self.ttl=ttl
+        # key -> (value, table generations, expiry time, approximate size in bytes)
+        self._entries=OrderedDict()
+        self._lock=threading.Lock()
+        self.bytes=0
+        self.hits=0
+        self.misses=0
+        self.invalidations=0
+        self.expirations=0
+        self.evictions=0
+
+    # return (True, value) for a fresh entry, (False, None) otherwise
+    def get(self,key,generations):
+        with self._lock:
+            entry=self._entries.get(key)
+            if entry is None:
+                self.misses+=1
+                return False, None
+            value,entry_generations,expires,size=entry
+            if entry_generations!=generations or (expires is not None and time.monotonic()>=expires):
+                # stale: one of the tables changed or the ttl ran out
+                if entry_generations!=generations:
+                    self.invalidations+=1
+                else:
+                    self.expirations+=1
+                self._remove(key)
+                self.misses+=1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits+=1
+            return True, value
+
+    def put(self,key,generations,value):
+        if self.maxsize<=0:
+            return
+        expires=time.monotonic()+self.ttl if self.ttl is not None else None
+        size=_approximate_size(value)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key]=(value,generations,expires,size)
+            self.bytes+=size
+            while len(self._entries)>self.maxsize:
+                self._remove(next(iter(self._entries)))
+                self.evictions+=1
+
+    # remove an entry (caller holds the lock)
+    def _remove(self,key):
+        self.bytes-=self._entries.pop(key)[3]
+
+    # drop every cached result and reset the counters
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes=0
+            self.hits=self.misses=self.invalidations=self.expirations=self.evictions=0
+
+    # snapshot of the counters
+    def stats(self):
+        lookups=self.hits+self.misses
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'bytes': self.bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'expirations': self.expirations,
+            'evictions': self.evictions,
+            'hit_rate': self.hits/lookups if lookups else 0.0,
+        }
+
+    def __len__(self):
+        return len(self._entries)
+
+# shallow size of a result and the items in it, good enough to watch memory use
+def _approximate_size(value):
+    size=sys.getsizeof(value)
+    if isinstance(value,(list,tuple)):
+        size+=sum(sys.getsizeof(item) for item in value)
+    return size
+
+# shared cache for the relationship methods
+result_cache=ResultCache()
+
+# decorator memoizing an instance method on (db, method, instance id, arguments)
+# tables are the tables the result is computed from, any model write to them invalidates it
+def cached_result(*tables):
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self,*args,**kwargs):
+            # unsaved instances have no id to key on
+            if self.id is None or result_cache.maxsize<=0:
+                return method(self,*args,**kwargs)
+            key=(database_utils.DB_FILE, method.__qualname__, self.id, args, tuple(sorted(kwargs.items())))
+            generations=database_utils.table_generations(tables)
+            found,value=result_cache.get(key,generations)
+            if not found:
+                value=method(self,*args,**kwargs)
+                result_cache.put(key,generations,value)
+            # a copy so callers can change the list without changing the cached one
+            return list(value)
+        return wrapper
+    return decorate
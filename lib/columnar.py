@@ -0,0 +1,211 @@
+# columnar snapshot of the articles graph for whole-dataset analytics
+# articles(author_id, magazine_id) and magazines.category are loaded into flat int64 columns
+# instead of Article/Author/Magazine objects, and the aggregates are bincount/sort based group-bys
+# numpy is optional: without it the columns are array-module arrays and the group-bys use Counter
+import ast
+import json
+import mmap
+import os
+import sys
+from array import array
+from collections import Counter
+
+from .database_utils import checkout, iter_rows
+
+try:
+    import numpy
+except ImportError:
+    numpy=None
+
+# bump when the files written by save() change
+SNAPSHOT_FORMAT=1
+
+# the int64 columns of a snapshot, each saved as <name>.npy
+COLUMNS=('author_ids', 'magazine_ids', 'magazine_category')
+
+class ArticleColumns:
+    def __init__(self,author_ids,magazine_ids,magazine_category,categories,signature=None):
+        # author and magazine id of every article, in article id order
+        self.author_ids=_column(author_ids)
+        self.magazine_ids=_column(magazine_ids)
+        # category code of every magazine id (index), -1 when there is no such magazine
+        self.magazine_category=_column(magazine_category)
+        # category names, a code is an index into this list
+        self.categories=categories
+        # what the db looked like when the snapshot was taken, see _signature()
+        self.signature=signature
+
+    # read the columns from the current db, rows are streamed so no article objects are built
+    @classmethod
+    def from_db(cls):
+        author_ids=array('q')
+        magazine_ids=array('q')
+        for author_id,magazine_id in iter_rows('''
+            SELECT author_id, magazine_id FROM articles
+            WHERE author_id IS NOT NULL AND magazine_id IS NOT NULL
+            ORDER BY id'''):
+            author_ids.append(author_id)
+            magazine_ids.append(magazine_id)
+        magazines=list(iter_rows("SELECT id, category FROM magazines ORDER BY id"))
+        # codes in order of first appearance, so the same db always gives the same codes
+        codes={}
+        for _,category in magazines:
+            codes.setdefault(category,len(codes))
+        size=max([m[0] for m in magazines]+[max(magazine_ids,default=-1)],default=-1)+1
+        magazine_category=array('q',[-1])*size
+        for magazine_id,category in magazines:
+            magazine_category[magazine_id]=codes[category]
+        return cls(author_ids,magazine_ids,magazine_category,list(codes),_signature())
+
+    # write the columns as .npy files (plus meta.json) to directory
+    def save(self,directory):
+        os.makedirs(directory,exist_ok=True)
+        for name in COLUMNS:
+            _write_npy(os.path.join(directory,f'{name}.npy'),getattr(self,name))
+        with open(os.path.join(directory,'meta.json'),'w',encoding='utf-8') as f:
+            json.dump({'format': SNAPSHOT_FORMAT, 'categories': self.categories, 'signature': self.signature}, f)
+
+    # memory-map a snapshot written by save(), the columns are only paged in when used
+    @classmethod
+    def load(cls,directory):
+        with open(os.path.join(directory,'meta.json'),encoding='utf-8') as f:
+            meta=json.load(f)
+        if meta.get('format')!=SNAPSHOT_FORMAT:
+            raise ValueError(f'snapshot in {directory} has format {meta.get("format")}, expected {SNAPSHOT_FORMAT}')
+        columns=[_read_npy(os.path.join(directory,f'{name}.npy')) for name in COLUMNS]
+        return cls(*columns,meta['categories'],meta['signature'])
+
+    # the cached snapshot in directory if the db has not changed since it was taken, otherwise a new one
+    @classmethod
+    def snapshot(cls,directory,refresh=False):
+        if not refresh and os.path.exists(os.path.join(directory,'meta.json')):
+            try:
+                columns=cls.load(directory)
+            except ValueError:
+                columns=None
+            if columns is not None and columns.signature==_signature():
+                return columns
+        columns=cls.from_db()
+        columns.save(directory)
+        return columns
+
+    def __len__(self):
+        return len(self.author_ids)
+
+    # magazine id -> number of articles
+    def articles_per_magazine(self):
+        return _counts(self.magazine_ids)
+
+    # author id -> number of articles
+    def articles_per_author(self):
+        return _counts(self.author_ids)
+
+    # (author id, magazine id) -> number of articles
+    def articles_per_author_magazine(self):
+        authors,magazines,counts=_pair_counts(self.author_ids,self.magazine_ids)
+        return dict(zip(zip(authors,magazines),counts))
+
+    # magazine id -> number of distinct authors
+    def contributors_per_magazine(self):
+        _,magazines,_=_pair_counts(self.author_ids,self.magazine_ids)
+        return _counts(magazines)
+
+    # magazine id -> ids of the authors with at least min_articles articles in it
+    # (the same authors as Magazine.all_contributing_authors)
+    def contributing_authors(self,min_articles=3):
+        magazines,authors,counts=_pair_counts(self.magazine_ids,self.author_ids)
+        result={}
+        for magazine_id,author_id,count in zip(magazines,authors,counts):
+            if count>=min_articles:
+                result.setdefault(magazine_id,[]).append(author_id)
+        return result
+
+    # author id -> number of distinct categories written in
+    def categories_per_author(self):
+        if numpy is not None:
+            categories=self.magazine_category[self.magazine_ids]
+            known=categories>=0
+            authors,_,_=_pair_counts(self.author_ids[known],categories[known])
+        else:
+            categories=[self.magazine_category[m] for m in self.magazine_ids]
+            pairs={(a,c) for a,c in zip(self.author_ids,categories) if c>=0}
+            authors=[a for a,_ in pairs]
+        return _counts(authors)
+
+    # sorted ids of the authors writing in at least min_categories categories
+    def authors_in_categories(self,min_categories=2):
+        return sorted(a for a,n in self.categories_per_author().items() if n>=min_categories)
+
+# a column as a numpy array when numpy is available, otherwise as given (array or memoryview)
+def _column(values):
+    if numpy is not None and not isinstance(values,numpy.ndarray):
+        return numpy.frombuffer(values,dtype=numpy.int64) if len(values) else numpy.zeros(0,dtype=numpy.int64)
+    return values
+
+# value -> number of occurrences, in value order
+def _counts(values):
+    if numpy is not None:
+        counts=numpy.bincount(numpy.asarray(values,dtype=numpy.int64))
+        present=numpy.flatnonzero(counts)
+        return dict(zip(present.tolist(),counts[present].tolist()))
+    return dict(sorted(Counter(values).items()))
+
+# distinct (a, b) pairs sorted by a then b, as three parallel lists a, b, number of occurrences
+def _pair_counts(a,b):
+    if numpy is not None:
+        if not len(a):
+            return [],[],[]
+        # encode each pair as one int64 so a single sort finds the distinct pairs
+        width=int(b.max())+1
+        keys,counts=numpy.unique(a*width+b,return_counts=True)
+        return (keys//width).tolist(),(keys%width).tolist(),counts.tolist()
+    pairs=sorted(Counter(zip(a,b)).items())
+    return [p[0][0] for p in pairs],[p[0][1] for p in pairs],[p[1] for p in pairs]
+
+# stamp of the rows a snapshot is built from, a cached snapshot is only reused while it matches
+# the change counters (migration 6) are bumped by triggers on every article insert, delete or
+# author/magazine change and every magazine category change, count and max id tell databases apart
+def _signature():
+    with checkout() as conn:
+        count,max_id=conn.execute("SELECT COUNT(*), MAX(id) FROM articles").fetchone()
+        versions=dict(conn.execute("SELECT name, version FROM change_counters"))
+    return [count,max_id,versions['articles'],versions['magazines']]
+
+# write an int64 column in the .npy format (version 1.0), numpy.load can memory-map it
+def _write_npy(path,values):
+    if numpy is not None:
+        numpy.save(path,numpy.asarray(values,dtype=numpy.int64))
+        return
+    values=array('q',values)
+    if sys.byteorder!='little':
+        values.byteswap()
+    header=repr({'descr': '<i8', 'fortran_order': False, 'shape': (len(values),)})
+    # the data starts on a 64 byte boundary, the header is padded with spaces and ends with a newline
+    header+=' '*(-(10+len(header)+1)%64)+'\n'
+    with open(path,'wb') as f:
+        f.write(b'\x93NUMPY\x01\x00'+len(header).to_bytes(2,'little')+header.encode('latin1'))
+        values.tofile(f)
+
+# memory-map an int64 .npy column written by _write_npy
+def _read_npy(path):
+    if numpy is not None:
+        return numpy.load(path,mmap_mode='r')
+    with open(path,'rb') as f:
+        if f.read(8)!=b'\x93NUMPY\x01\x00':
+            raise ValueError(f'{path} is not a version 1.0 .npy file')
+        header_len=int.from_bytes(f.read(2),'little')
+        header=ast.literal_eval(f.read(header_len).decode('latin1'))
+        if header['descr']!='<i8' or header['fortran_order']:
+            raise ValueError(f'{path} does not hold a little-endian int64 column')
+        offset=10+header_len
+        if header['shape'][0]==0:
+            return array('q')
+        if sys.byteorder!='little':
+            f.seek(offset)
+            values=array('q')
+            values.fromfile(f,header['shape'][0])
+            values.byteswap()
+            return values
+        # the mapping stays open as long as the returned view is referenced
+        mapped=mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+    return memoryview(mapped)[offset:].cast('q')
@@ -1,42 +1,573 @@
 # database connection setup
+import atexit
+import itertools
 import sqlite3
+import threading
+import weakref
+from contextlib import contextmanager
+
+from . import instrumentation
 
 DB_FILE='magazine.db'
 
+# pragmas applied once to every new pooled connection
+PRAGMAS=(
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA foreign_keys=ON",
+    "PRAGMA cache_size=-16000",  # negative means KiB, so roughly 16MB of page cache
+    "PRAGMA mmap_size=268435456",  # memory map up to 256MB of the db file
+)
+
+# connection handed out by the pool, close() checks it back in instead of closing it
+class PooledConnection(sqlite3.Connection):
+    # number of session() blocks currently open on this connection
+    session_depth=0
+    # db file or uri this connection was opened on
+    db_file=None
+    # tables written in the current transaction, their generations are bumped again when it ends
+    written_tables=None
+    # get_connection() checkouts not given back with close() yet
+    checkouts=0
+    # (instance, _id, _dirty) of every model instance written inside the open session, in write order,
+    # so rolling the session or one of its savepoints back also puts the instances back as they were
+    saved_instances=None
+
+    # cursors are instrumented only while instrumentation is active, otherwise plain sqlite3 cursors
+    def cursor(self,factory=None):
+        if factory is None:
+            factory=instrumentation.InstrumentedCursor if instrumentation.active else sqlite3.Cursor
+        return sqlite3.Connection.cursor(self,factory)
+
+    # the C level execute shortcuts bypass cursor(), so route them through it when instrumenting
+    def execute(self,sql,parameters=()):
+        if instrumentation.active:
+            return self.cursor().execute(sql,parameters)
+        return sqlite3.Connection.execute(self,sql,parameters)
+
+    def executemany(self,sql,parameters):
+        if instrumentation.active:
+            return self.cursor().executemany(sql,parameters)
+        return sqlite3.Connection.executemany(self,sql,parameters)
+
+    # inside a session the commit is deferred until the outermost session() exits
+    def commit(self):
+        if self.session_depth==0:
+            sqlite3.Connection.commit(self)
+            self.saved_instances=None
+            self._transaction_ended()
+
+    def rollback(self):
+        sqlite3.Connection.rollback(self)
+        self._restore_instances()
+        self._transaction_ended()
+
+    # undo the in-memory effects of the saves recorded from position start on (newest first):
+    # ids assigned by a rolled back insert are taken back, and the changed columns are dirty again
+    # so the next save() writes them; every such instance is dropped from the identity map, since
+    # it no longer matches its row and find_by_id() must load the rolled back values from the db
+    def _restore_instances(self,start=0):
+        saved=self.saved_instances or []
+        for obj,id,dirty in reversed(saved[start:]):
+            identity_map=getattr(type(obj),'identity_map',None)
+            if obj._id is not None and identity_map is not None:
+                identity_map.discard(obj._id)
+            obj._id=id
+            obj._dirty=dirty
+        del saved[start:]
+
+    # bump the tables written in the finished transaction so results cached while it was open are dropped
+    def _transaction_ended(self):
+        if self.written_tables:
+            tables,self.written_tables=self.written_tables,None
+            bump_generations(tables,self.db_file)
+
+    def close(self):
+        self.checkouts=max(self.checkouts-1,0)
+        # throw away an unfinished transaction so the next caller starts clean, but only when the
+        # outermost checkout ends: a nested checkout (e.g. a model read) must not discard the writes
+        # of a caller still holding the connection, nor those of an open session
+        if self.checkouts==0 and self.in_transaction and self.session_depth==0:
+            self.rollback()
+
+    # really close the underlying sqlite connection (used by close_connections)
+    def _close(self):
+        sqlite3.Connection.close(self)
+
+# pool of open connections keyed by (thread key, db file) so every thread reuses its own connection
+_pool={}
+_pool_lock=threading.Lock()
+
+# per-thread marker, dropped by python when its thread exits, which closes that thread's pooled
+# connections (threads that come and go, e.g. executor workers, would otherwise leak one each)
+class _ThreadMarker:
+    __slots__=('key', '__weakref__')
+
+_thread_state=threading.local()
+# thread keys are never reused, unlike thread idents
+_thread_keys=itertools.count()
+
+def _thread_key():
+    marker=getattr(_thread_state,'marker',None)
+    if marker is None:
+        marker=_thread_state.marker=_ThreadMarker()
+        marker.key=next(_thread_keys)
+        weakref.finalize(marker,_release_thread,marker.key)
+    return marker.key
+
+# close the pooled connections of a thread that has exited
+def _release_thread(thread_key):
+    with _pool_lock:
+        keys=[key for key in _pool if key[0]==thread_key]
+        conns=[_pool.pop(key) for key in keys]
+    for conn in conns:
+        conn._close()
+
+# open a new connection and apply the pragmas once
+def _open_connection(db_file):
+    # file: uris are used for the shared in-memory databases
+    conn=sqlite3.connect(db_file, factory=PooledConnection, check_same_thread=False, uri=db_file.startswith('file:'))
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    conn.db_file=db_file
+    return conn
+
 # function to be used to connect to the database
 def get_connection():
-    return sqlite3.connect(DB_FILE)
+    key=(_thread_key(), DB_FILE)
+    conn=_pool.get(key)
+    if conn is None:
+        conn=_open_connection(DB_FILE)
+        with _pool_lock:
+            _pool[key]=conn
+    conn.checkouts+=1
+    if instrumentation.active:
+        instrumentation.record_checkout()
+    return conn
 
-# creating the db tables with the proper foreign key constraints
+# get_connection() as a context manager that gives the connection back even when the block raises
+# (a checkout that is never given back keeps close() from ever rolling back an abandoned transaction)
+@contextmanager
+def checkout():
+    conn=get_connection()
+    try:
+        yield conn
+    finally:
+        conn.close()
 
-def create_tables():
-# connection to the db
+# shutdown hook that really closes every pooled connection (or only those to db_file)
+def close_connections(db_file=None):
+    with _pool_lock:
+        keys=[key for key in _pool if db_file is None or key[1]==db_file]
+        conns=[_pool.pop(key) for key in keys]
+    for conn in conns:
+        conn._close()
+
+atexit.register(close_connections)
+
+# one extra connection per in-memory database, it lives as long as one connection to it is open
+_memory_keepers={}
+
+# uri of the named in-memory database, shared by every connection of this process
+# the memdb vfs (a name starting with /) uses normal file locking, so concurrent writers wait on the
+# busy timeout, whereas shared-cache (cache=shared) table locks fail at once with SQLITE_LOCKED
+def memory_uri(name):
+    return f'file:/{name}?vfs=memdb'
+
+# switch DB_FILE to the named in-memory database, creating it if needed
+# template (a db path or uri, e.g. schema_template()) is copied in first so no DDL has to run
+def use_memory_database(name='magazine',template=None):
+    global DB_FILE
+    uri=memory_uri(name)
+    if uri not in _memory_keepers:
+        _memory_keepers[uri]=sqlite3.connect(uri, uri=True, check_same_thread=False)
+    DB_FILE=uri
+    if template is not None:
+        copy_database(template, uri)
+    return uri
+
+# close every connection to the named in-memory database, which frees it
+def drop_memory_database(name='magazine'):
+    uri=memory_uri(name)
+    close_connections(uri)
+    keeper=_memory_keepers.pop(uri, None)
+    if keeper is not None:
+        keeper.close()
+    # a database created later under the same name must not see the old instances or results
+    from .cache import IdentityMap
+    IdentityMap.clear_all()
+    bump_generations(('authors', 'magazines', 'articles'), uri)
+
+# in-memory database with the current schema already migrated, built once per process
+def schema_template():
+    global DB_FILE
+    uri=memory_uri('schema_template')
+    if uri not in _memory_keepers:
+        current=DB_FILE
+        use_memory_database('schema_template')
+        try:
+            migrate()
+        finally:
+            DB_FILE=current
+    return uri
+
+# copy a whole database (path or uri) over another with the sqlite backup api
+def copy_database(source,target):
+    src=sqlite3.connect(source, uri=source.startswith('file:'))
+    dst=sqlite3.connect(target, uri=target.startswith('file:'))
+    try:
+        src.backup(dst)
+    finally:
+        src.close()
+        dst.close()
+
+# write the current database to a file
+def snapshot(path):
+    copy_database(DB_FILE, path)
+
+# replace the current database with the contents of a snapshot file
+def restore(path):
+    copy_database(path, DB_FILE)
+    # cached instances and results may not match the restored data
+    from .cache import IdentityMap
+    IdentityMap.clear_all()
+    bump_generations(('authors', 'magazines', 'articles'))
+
+# number of rows written per transaction by the bulk APIs
+BULK_CHUNK_SIZE=10000
+
+# number of rows fetched per round trip by the streaming iter_* methods
+FETCH_BATCH_SIZE=1000
+
+# split any iterable into lists of at most size items without loading it all at once
+def chunked(iterable,size):
+    chunk=[]
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk)>=size:
+            yield chunk
+            chunk=[]
+    if chunk:
+        yield chunk
+
+# max number of ? parameters per statement (SQLite's historic SQLITE_MAX_VARIABLE_NUMBER default)
+SQL_VARIABLE_LIMIT=999
+
+# run sql once per chunk of ids (sql has an {ids} placeholder for the IN list)
+# and return a dict of first column (the id) -> row
+def rows_by_ids(sql,ids,chunk_size=SQL_VARIABLE_LIMIT):
+    rows={}
+    with checkout() as conn:
+        for chunk in chunked(dict.fromkeys(ids),chunk_size):
+            placeholders=",".join("?"*len(chunk))
+            for row in conn.execute(sql.format(ids=placeholders),chunk):
+                rows[row[0]]=row
+    return rows
+
+# generator over the rows of a query, fetched batch_size rows at a time
+def iter_rows(sql,params=(),batch_size=FETCH_BATCH_SIZE):
     conn=get_connection()
     cursor=conn.cursor()
-    cursor.execute("PRAGMA foreign_keys = ON;")
-# creating the authors table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS authors(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL)''')
-# creating the magazines table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS magazines(
+    try:
+        cursor.execute(sql,params)
+        while True:
+            rows=cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        cursor.close()
+        conn.close()
+
+# generation counter per (db file, table), bumped on every model write
+# so cached results can tell whether the tables they were computed from have changed
+_generations={}
+_generations_lock=threading.Lock()
+
+# bump the generation of each table (of db_file, default the current DB_FILE)
+def bump_generations(tables,db_file=None):
+    db_file=db_file or DB_FILE
+    with _generations_lock:
+        for table in tables:
+            key=(db_file,table)
+            _generations[key]=_generations.get(key,0)+1
+
+# current generations of the tables of the current DB_FILE
+def table_generations(tables):
+    return tuple(_generations.get((DB_FILE,table),0) for table in tables)
+
+# record that tables were written on conn: bump them now and once more when the transaction ends
+def mark_written(conn,*tables):
+    bump_generations(tables,conn.db_file)
+    if conn.in_transaction:
+        conn.written_tables=(conn.written_tables or frozenset())|frozenset(tables)
+
+# unit of work: every save() inside the block joins one transaction that commits once at exit
+# and rolls back on an exception, nested blocks become savepoints
+@contextmanager
+def session():
+    conn=get_connection()
+    depth=conn.session_depth
+    # instances saved from here on belong to this block
+    mark=len(conn.saved_instances or ())
+    try:
+        if depth==0:
+            # take the write lock up front so the transaction never has to upgrade from a read lock
+            conn.execute("BEGIN IMMEDIATE")
+        else:
+            conn.execute(f"SAVEPOINT session_{depth}")
+        conn.session_depth=depth+1
+        try:
+            yield conn
+        except BaseException:
+            conn.session_depth=depth
+            if depth==0:
+                conn.rollback()
+            else:
+                # undo only the nested block and keep the outer transaction going
+                conn.execute(f"ROLLBACK TO session_{depth}")
+                conn.execute(f"RELEASE session_{depth}")
+                conn._restore_instances(mark)
+                # results cached after a write inside the savepoint must not outlive its rollback
+                # (written_tables covers the whole transaction, a superset of the savepoint's tables)
+                if conn.written_tables:
+                    bump_generations(conn.written_tables,conn.db_file)
+            raise
+        conn.session_depth=depth
+        if depth==0:
+            conn.commit()
+        else:
+            conn.execute(f"RELEASE session_{depth}")
+    finally:
+        conn.close()
+
+# remember the _id/_dirty of model instances about to be written, when inside a session()
+# (outside one every write commits at once, so there is nothing to undo later)
+def track_instances(objs):
+    with checkout() as conn:
+        if conn.session_depth:
+            if conn.saved_instances is None:
+                conn.saved_instances=[]
+            conn.saved_instances.extend((obj, obj._id, set(obj._dirty) if obj._dirty else obj._dirty) for obj in objs)
+
+# run an executemany insert (and optional update) of table in one transaction and return the new ids in order
+def bulk_write(table,insert_sql,insert_rows,update_sql=None,update_rows=()):
+    new_ids=[]
+    # nothing to write (e.g. every instance was unchanged), so no transaction and no invalidation
+    if not insert_rows and not update_rows:
+        return new_ids
+    # a session of its own, or a savepoint when called inside an open session
+    with session() as conn:
+        mark_written(conn,table)
+        cursor=conn.cursor()
+        if insert_rows:
+            cursor.executemany(insert_sql,insert_rows)
+# executemany does not set lastrowid, but AUTOINCREMENT ids inside one write transaction
+# are consecutive, so they can be derived from the last inserted rowid
+            last_id=cursor.execute("SELECT last_insert_rowid()").fetchone()[0]
+            new_ids=list(range(last_id-len(insert_rows)+1,last_id+1))
+        if update_rows:
+            cursor.executemany(update_sql,update_rows)
+    return new_ids
+
+# trigger bodies that count an article (row is new or old) in the aggregate tables
+_COUNTS_ADD='''
+            INSERT INTO author_magazine_counts(magazine_id, author_id, article_count)
+                SELECT {row}.magazine_id, {row}.author_id, 1
+                WHERE {row}.magazine_id IS NOT NULL AND {row}.author_id IS NOT NULL
+                ON CONFLICT(magazine_id, author_id) DO UPDATE SET article_count=article_count+1;
+            INSERT INTO magazine_article_counts(magazine_id, article_count)
+                SELECT {row}.magazine_id, 1 WHERE {row}.magazine_id IS NOT NULL
+                ON CONFLICT(magazine_id) DO UPDATE SET article_count=article_count+1;'''
+_COUNTS_REMOVE='''
+            UPDATE author_magazine_counts SET article_count=article_count-1
+                WHERE magazine_id={row}.magazine_id AND author_id={row}.author_id;
+            DELETE FROM author_magazine_counts
+                WHERE magazine_id={row}.magazine_id AND author_id={row}.author_id AND article_count<=0;
+            UPDATE magazine_article_counts SET article_count=article_count-1
+                WHERE magazine_id={row}.magazine_id;
+            DELETE FROM magazine_article_counts
+                WHERE magazine_id={row}.magazine_id AND article_count<=0;'''
+
+# the aggregate tables recomputed from scratch from the articles table
+_EXPECTED_COUNTS={
+    'author_magazine_counts': '''SELECT magazine_id, author_id, COUNT(*) FROM articles
+        WHERE magazine_id IS NOT NULL AND author_id IS NOT NULL
+        GROUP BY magazine_id, author_id''',
+    'magazine_article_counts': '''SELECT magazine_id, COUNT(*) FROM articles
+        WHERE magazine_id IS NOT NULL
+        GROUP BY magazine_id''',
+}
+_REBUILD_COUNTS=[
+    statement
+    for table,query in _EXPECTED_COUNTS.items()
+    for statement in (f"DELETE FROM {table}", f"INSERT INTO {table} {query}")
+]
+
+# trigger bumping the change counter of table on event (migration 6)
+_CHANGE_TRIGGER='''CREATE TRIGGER IF NOT EXISTS {table}_changes_{name} AFTER {event} ON {table} BEGIN
+            UPDATE change_counters SET version=version+1 WHERE name='{table}';
+        END'''
+
+# schema migrations applied in order, PRAGMA user_version records how many have already run
+# add new schema changes by appending to this list, never edit an entry that has shipped
+MIGRATIONS=[
+# 1: the authors, magazines and articles tables with the proper foreign key constraints
+    (
+        '''CREATE TABLE IF NOT EXISTS authors(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL)''',
+        '''CREATE TABLE IF NOT EXISTS magazines(
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             name TEXT NOT NULL,
-            category TEXT NOT NULL)''')
-
-# creating the articles table with foreign keys to authors and magazines
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS articles(
+            category TEXT NOT NULL)''',
+        '''CREATE TABLE IF NOT EXISTS articles(
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             title TEXT NOT NULL,
             author_id INTEGER,
             magazine_id INTEGER,
             FOREIGN KEY (author_id) REFERENCES authors(id),
-            FOREIGN KEY (magazine_id) REFERENCES magazines(id))''')
-# save the changes and close the connection
-    conn.commit()
-    conn.close()
+            FOREIGN KEY (magazine_id) REFERENCES magazines(id))''',
+    ),
+# 2: covering indexes for the relationship queries so they no longer scan every article
+    (
+        "CREATE INDEX IF NOT EXISTS idx_articles_magazine_author ON articles(magazine_id, author_id)",
+        "CREATE INDEX IF NOT EXISTS idx_articles_author_magazine ON articles(author_id, magazine_id)",
+    ),
+# 3: (owner, id) indexes so keyset pagination seeks straight to the next page in id order
+    (
+        "CREATE INDEX IF NOT EXISTS idx_articles_magazine_id ON articles(magazine_id, id)",
+        "CREATE INDEX IF NOT EXISTS idx_articles_author_id ON articles(author_id, id)",
+    ),
+# 4: fts5 full text index over article titles, kept in sync with articles by triggers
+    (
+        '''CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts
+            USING fts5(title, content='articles', content_rowid='id')''',
+        '''CREATE TRIGGER IF NOT EXISTS articles_fts_insert AFTER INSERT ON articles BEGIN
+            INSERT INTO articles_fts(rowid, title) VALUES (new.id, new.title);
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS articles_fts_delete AFTER DELETE ON articles BEGIN
+            INSERT INTO articles_fts(articles_fts, rowid, title) VALUES ('delete', old.id, old.title);
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS articles_fts_update AFTER UPDATE OF title ON articles BEGIN
+            INSERT INTO articles_fts(articles_fts, rowid, title) VALUES ('delete', old.id, old.title);
+            INSERT INTO articles_fts(rowid, title) VALUES (new.id, new.title);
+        END''',
+# index the articles that already exist
+        "INSERT INTO articles_fts(articles_fts) VALUES ('rebuild')",
+    ),
+# 5: article counts per (magazine, author) and per magazine, kept up to date by triggers
+    (
+        '''CREATE TABLE IF NOT EXISTS author_magazine_counts(
+            magazine_id INTEGER NOT NULL,
+            author_id INTEGER NOT NULL,
+            article_count INTEGER NOT NULL,
+            PRIMARY KEY (magazine_id, author_id)) WITHOUT ROWID''',
+        "CREATE INDEX IF NOT EXISTS idx_author_magazine_counts_author ON author_magazine_counts(author_id, magazine_id)",
+        '''CREATE TABLE IF NOT EXISTS magazine_article_counts(
+            magazine_id INTEGER PRIMARY KEY,
+            article_count INTEGER NOT NULL)''',
+        f'''CREATE TRIGGER IF NOT EXISTS articles_counts_insert AFTER INSERT ON articles BEGIN
+            {_COUNTS_ADD.format(row='new')}
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS articles_counts_delete AFTER DELETE ON articles BEGIN
+            {_COUNTS_REMOVE.format(row='old')}
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS articles_counts_update AFTER UPDATE OF author_id, magazine_id ON articles BEGIN
+            {_COUNTS_REMOVE.format(row='old')}
+            {_COUNTS_ADD.format(row='new')}
+        END''',
+# fill the counts for the articles that already exist
+        *_REBUILD_COUNTS,
+    ),
+# 6: change counters bumped by triggers on every write that moves an article or recategorizes a magazine,
+# so derived data (e.g. the columnar snapshots) can tell cheaply whether it is still current
+    (
+        '''CREATE TABLE IF NOT EXISTS change_counters(
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL) WITHOUT ROWID''',
+        "INSERT OR IGNORE INTO change_counters(name, version) VALUES ('articles', 0), ('magazines', 0)",
+        *(_CHANGE_TRIGGER.format(table=table, name=event.split()[0].lower(), event=event)
+          for table,events in (
+              ('articles', ('INSERT', 'DELETE', 'UPDATE OF author_id, magazine_id')),
+              ('magazines', ('INSERT', 'DELETE', 'UPDATE OF category')))
+          for event in events),
+    ),
+# 7: name indexes so the importer's name -> id lookups (lib/transfer.py) seek instead of scanning the table
+    (
+        "CREATE INDEX IF NOT EXISTS idx_authors_name ON authors(name)",
+        "CREATE INDEX IF NOT EXISTS idx_magazines_name ON magazines(name)",
+    ),
+]
+
+# current schema version of the connected db
+def schema_version(conn=None):
+    if conn is not None:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+    with checkout() as conn:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+
+# roll the schema forward to the latest migration, each migration in its own transaction
+def migrate():
+# nothing to do when the schema is already current
+    version=schema_version()
+    if version>=len(MIGRATIONS):
+        return version
+    while True:
+        with session() as conn:
+# read the version again under the write lock in case another process migrated meanwhile
+            version=schema_version(conn)
+            if version>=len(MIGRATIONS):
+                return version
+            for statement in MIGRATIONS[version]:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version={version+1}")
+
+# creating (or upgrading) the db tables
+def create_tables():
+    migrate()
     print("Database created successfully!")
-    
\ No newline at end of file
+
+# rebuild the article title search index from the articles table
+def rebuild_search_index():
+    with session() as conn:
+        conn.execute("INSERT INTO articles_fts(articles_fts) VALUES ('rebuild')")
+
+# compare the aggregate count tables with the articles table
+# returns the number of wrong or missing rows per table (all zero when consistent)
+def check_aggregates():
+    mismatches={}
+    with checkout() as conn:
+        for table,query in _EXPECTED_COUNTS.items():
+            # rows that differ in either direction
+            mismatches[table]=conn.execute(f'''
+                SELECT (SELECT COUNT(*) FROM (SELECT * FROM ({query}) EXCEPT SELECT * FROM {table}))
+                     + (SELECT COUNT(*) FROM (SELECT * FROM {table} EXCEPT SELECT * FROM ({query})))''').fetchone()[0]
+    return mismatches
+
+# recompute the aggregate count tables from the articles table
+def rebuild_aggregates():
+    with session() as conn:
+        for statement in _REBUILD_COUNTS:
+            conn.execute(statement)
+
+# maintenance commands: python -m lib.database_utils COMMAND [--db FILE]
+def main(argv=None):
+    import argparse
+    global DB_FILE
+    commands={
+        'migrate': migrate,
+        'rebuild-search-index': rebuild_search_index,
+        'check-aggregates': check_aggregates,
+        'rebuild-aggregates': rebuild_aggregates,
+    }
+    parser=argparse.ArgumentParser(description='Database maintenance commands')
+    parser.add_argument('command', choices=commands)
+    parser.add_argument('--db', default=DB_FILE, help='database file (default: %(default)s)')
+    args=parser.parse_args(argv)
+    DB_FILE=args.db
+    result=commands[args.command]()
+    print(f'{args.command}: {result if result is not None else "done"}')
+
+if __name__=='__main__':
+    main()
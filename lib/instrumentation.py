@@ -0,0 +1,197 @@
+# query instrumentation: statement counts, timings, rows and a slow query log
+# nothing is recorded (and cursors are plain sqlite3 cursors) unless a capture() block
+# is open or the slow query log is enabled
+import contextvars
+import logging
+import os
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+from time import perf_counter
+
+logger=logging.getLogger('lib.sql')
+
+# True while anything needs query records, checked by the pooled connection before instrumenting
+active=False
+
+# collectors of the capture() blocks open in the current context (thread or asyncio task),
+# run_in_db and the write queue carry the context over to the threads doing the work
+_scoped=contextvars.ContextVar('lib_sql_collectors', default=())
+# open capture(all_threads=True) collectors, they see the statements of every thread
+_collectors=[]
+# number of open capture() blocks of either kind
+_open=0
+_lock=threading.Lock()
+# statements slower than this many milliseconds are logged (None disables the log)
+_slow_query_ms=None
+
+# model modules whose methods queries are attributed to
+_MODEL_FILES={os.path.join(os.path.dirname(os.path.abspath(__file__)), name)
+              for name in ('author.py', 'magazine.py', 'article.py')}
+
+# one executed statement
+class QueryRecord:
+    __slots__=('sql','params','rows','seconds','caller','logged')
+
+    def __init__(self,sql,params,seconds,caller):
+        self.sql=sql
+        # number of parameters (number of parameter sets for executemany)
+        self.params=params
+        # rows fetched so far
+        self.rows=0
+        # wall time spent executing and fetching
+        self.seconds=seconds
+        # outermost model method that issued the statement
+        self.caller=caller
+        self.logged=False
+
+    def __repr__(self):
+        return f'<QueryRecord {self.caller} rows={self.rows} ms={self.seconds*1000:.3f} sql={self.sql.strip()[:60]!r}>'
+
+# statements collected by one capture() block
+class QueryStats:
+    def __init__(self):
+        self.queries=[]
+        self.connections=0
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def rows(self):
+        return sum(q.rows for q in self.queries)
+
+    @property
+    def seconds(self):
+        return sum(q.seconds for q in self.queries)
+
+    # totals aggregated per calling model method
+    def by_caller(self):
+        totals={}
+        for q in self.queries:
+            entry=totals.setdefault(q.caller, {'queries': 0, 'rows': 0, 'seconds': 0.0})
+            entry['queries']+=1
+            entry['rows']+=q.rows
+            entry['seconds']+=q.seconds
+        return totals
+
+def _update_active():
+    global active
+    active=_open>0 or _slow_query_ms is not None
+
+# record every statement run inside the block by this thread or asyncio task
+# (including the work it hands to run_in_db or the write queue)
+# all_threads=True records the statements of every thread of the process instead
+@contextmanager
+def capture(all_threads=False):
+    global _open
+    stats=QueryStats()
+    with _lock:
+        _open+=1
+        if all_threads:
+            _collectors.append(stats)
+        _update_active()
+    token=None if all_threads else _scoped.set(_scoped.get()+(stats,))
+    try:
+        yield stats
+    finally:
+        if token is not None:
+            _scoped.reset(token)
+        with _lock:
+            _open-=1
+            if all_threads:
+                _collectors.remove(stats)
+            _update_active()
+
+# collectors that see a statement run in the current context
+def _current_collectors():
+    scoped=_scoped.get()
+    return [*_collectors, *scoped] if _collectors else scoped
+
+# log statements taking at least threshold_ms milliseconds to the 'lib.sql' logger (None turns it off)
+def set_slow_query_threshold(threshold_ms):
+    global _slow_query_ms
+    with _lock:
+        _slow_query_ms=threshold_ms
+        _update_active()
+
+# called by get_connection for every checkout
+def record_checkout():
+    for stats in _current_collectors():
+        stats.connections+=1
+
+# qualified name of the outermost model method on the stack
+def _find_caller():
+    caller=None
+    frame=sys._getframe(3)
+    while frame is not None:
+        code=frame.f_code
+        if code.co_filename in _MODEL_FILES:
+            caller=getattr(code, 'co_qualname', code.co_name)
+        frame=frame.f_back
+    return caller or '<other>'
+
+def _check_slow(record):
+    if _slow_query_ms is not None and not record.logged and record.seconds*1000>=_slow_query_ms:
+        record.logged=True
+        logger.warning('slow query (%.1f ms, %d rows) in %s: %s',
+                       record.seconds*1000, record.rows, record.caller, ' '.join(record.sql.split()))
+
+# cursor that times statements and counts fetched rows
+class InstrumentedCursor(sqlite3.Cursor):
+    _record=None
+
+    def _start(self,sql,params,seconds):
+        record=QueryRecord(sql, params, seconds, _find_caller())
+        for stats in _current_collectors():
+            stats.queries.append(record)
+        self._record=record
+        _check_slow(record)
+
+    def _fetched(self,rows,seconds):
+        record=self._record
+        if record is not None:
+            record.rows+=rows
+            record.seconds+=seconds
+            _check_slow(record)
+
+    def execute(self,sql,parameters=()):
+        start=perf_counter()
+        try:
+            return super().execute(sql,parameters)
+        finally:
+            self._start(sql, len(parameters), perf_counter()-start)
+
+    def executemany(self,sql,seq_of_parameters):
+        start=perf_counter()
+        try:
+            return super().executemany(sql,seq_of_parameters)
+        finally:
+            count=len(seq_of_parameters) if hasattr(seq_of_parameters,'__len__') else None
+            self._start(sql, count, perf_counter()-start)
+
+    def fetchone(self):
+        start=perf_counter()
+        row=super().fetchone()
+        self._fetched(row is not None, perf_counter()-start)
+        return row
+
+    def fetchmany(self,size=None):
+        start=perf_counter()
+        rows=super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(len(rows), perf_counter()-start)
+        return rows
+
+    def fetchall(self):
+        start=perf_counter()
+        rows=super().fetchall()
+        self._fetched(len(rows), perf_counter()-start)
+        return rows
+
+    def __next__(self):
+        start=perf_counter()
+        row=super().__next__()
+        self._fetched(1, perf_counter()-start)
+        return row
@@ -1,6 +1,15 @@
-from .database_utils import get_connection
+from .database_utils import checkout, chunked, bulk_write, track_instances, iter_rows, rows_by_ids, BULK_CHUNK_SIZE, FETCH_BATCH_SIZE
+from .cache import IdentityMap, cached_result
+from .aio import run_in_db
+from .writer import write
 
 class Magazine:
+    # fixed attribute slots instead of a per-instance __dict__ to keep instances small
+    __slots__ = ('_id', '_name', '_category', '_dirty')
+
+    # identity map so the same magazine id always gives back the same instance
+    identity_map = IdentityMap(maxsize=1024)
+
     # initialize a new magazine instance
     def __init__(self, name, category, id=None):
         # store the db ID (none for new magazines)
@@ -9,6 +18,8 @@ class Magazine:
         self._name = None
         # initialize _category as none
         self._category = None
+        # columns changed since the magazine was loaded or last saved (None when there are none)
+        self._dirty = None
         # set name and categories with validation
         self.name = name
         self.category = category
@@ -32,8 +43,10 @@ class Magazine:
         # validate that the string is not empty
         if len(value) == 0:
             raise ValueError('Magazine name must be longer than 0 characters')
-        # store the name when all the validation checks pass
-        self._name = value
+        # store the name when all the validation checks pass (and remember it changed)
+        if value != self._name:
+            self._name = value
+            self._mark_dirty('name')
     
     # getter for magazines category
     @property
@@ -49,8 +62,16 @@ class Magazine:
         # validate that the string is not empty
         if len(value) == 0:
             raise ValueError('Magazine category must be longer than 0 characters')
-        # store the category when all the validation checks pass
-        self._category = value
+        # store the category when all the validation checks pass (and remember it changed)
+        if value != self._category:
+            self._category = value
+            self._mark_dirty('category')
+
+    # record that a column needs to be written by the next save()
+    def _mark_dirty(self, column):
+        if self._dirty is None:
+            self._dirty = set()
+        self._dirty.add(column)
 
     # class method to create a magazine instance from a db row
     @classmethod
@@ -58,107 +79,277 @@ class Magazine:
         # check whether row was returned
         if row is None:
             return None
-        # create and return a new magazine instance
-        return cls(name=row[1], category=row[2], id=row[0])
+        # reuse the cached instance for this id if there is one
+        magazine = cls.identity_map.get(row[0])
+        if magazine is None:
+            magazine = cls._from_row(row)
+        return magazine
+
+    # create a magazine from a trusted db row and register it in the identity map
+    @classmethod
+    def _from_row(cls, row):
+        return cls.identity_map.setdefault(row[0], cls._trusted(row[0], row[1], row[2]))
+
+    # build a magazine from values read from the db, skipping the setter validation
+    @classmethod
+    def _trusted(cls, id, name, category):
+        magazine = cls.__new__(cls)
+        magazine._id = id
+        magazine._name = name
+        magazine._category = category
+        magazine._dirty = None
+        return magazine
 
     # class method to find a magazine by id
     @classmethod
     def find_by_id(cls, id):
+        # return the cached instance without touching the db when possible
+        magazine = cls.identity_map.get(id)
+        if magazine is not None:
+            return magazine
         # db connection
-        conn = get_connection()
-        # cursor to execute the query
-        cursor = conn.cursor()
-        # execute a select query to find the magazine by id
-        cursor.execute("SELECT * FROM magazines WHERE id=?", (id,))
-        # fetch the first row from the result that matches
-        row = cursor.fetchone()
-        # close the connection
-        conn.close()
+        with checkout() as conn:
+            # cursor to execute the query
+            cursor = conn.cursor()
+            # execute a select query to find the magazine by id
+            cursor.execute("SELECT * FROM magazines WHERE id=?", (id,))
+            # fetch the first row from the result that matches
+            row = cursor.fetchone()
         # create and return a magazine instance from the row
-        return cls.new_from_db(row)
+        if row is None:
+            return None
+        return cls._from_row(row)
+
+    # class method to find many magazines at once, returned in input order (None for unknown ids)
+    # only ids missing from the identity map are queried, in chunked IN (...) queries
+    @classmethod
+    def find_by_ids(cls, ids):
+        ids = list(ids)
+        found = {}
+        misses = []
+        for id in dict.fromkeys(ids):
+            magazine = cls.identity_map.get(id)
+            if magazine is None:
+                misses.append(id)
+            else:
+                found[id] = magazine
+        for id, row in rows_by_ids("SELECT * FROM magazines WHERE id IN ({ids})", misses).items():
+            found[id] = cls._from_row(row)
+        return [found.get(id) for id in ids]
 
     # instance method to save the magazine to the db
     def save(self):
-        # db connection
-        conn = get_connection()
-        # cursor to execute the query
-        cursor = conn.cursor()
+        # nothing changed since the magazine was loaded or last saved, so there is nothing to write
+        if self._id is not None and not self._dirty:
+            type(self).identity_map.put(self._id, self)
+            return
+        # so a rolled back session() can put the id and changed columns back
+        track_instances((self,))
         # check whether the magazine already has an id or not
+        # write() commits it and invalidates cached results computed from the magazines table
+        # (through the single writer thread when the write queue is enabled, see lib/writer.py)
         if self._id is None:
             # means the magazine is new and needs to be inserted
-            cursor.execute("INSERT INTO magazines (name, category) VALUES (?,?)",
-                         (self._name, self._category))
-            # get the id of the newly inserted magazine
-            self._id = cursor.lastrowid
+            # and we get the id of the newly inserted magazine
+            self._id = write('magazines', "INSERT INTO magazines (name, category) VALUES (?,?)",
+                             (self._name, self._category))
             print(f'created new magazine with ID: {self._id}')
         else:
-            # magazine already exists and needs to be updated
-            cursor.execute("UPDATE magazines SET name=?, category=? WHERE id=?",
-                         (self._name, self._category, self._id))
+            # magazine already exists and needs to be updated, only the changed columns are written
+            columns = [column for column in ('name', 'category') if column in self._dirty]
+            write('magazines', f"UPDATE magazines SET {', '.join(f'{column}=?' for column in columns)} WHERE id=?",
+                  [getattr(self, '_' + column) for column in columns] + [self._id])
             print(f'updated magazine ID: {self._id}')
-        
-        # commit the changes and close the connection
-        conn.commit()
-        conn.close()
+        self._dirty = None
+        # this instance is now the cached one for its id
+        type(self).identity_map.put(self._id, self)
+
+    # class method to save many magazines at once in chunked transactions
+    # accepts Magazine instances or plain (name, category) tuples and returns the ids in input order
+    @classmethod
+    def save_many(cls, magazines, chunk_size=BULK_CHUNK_SIZE):
+        ids = []
+        for chunk in chunked(magazines, chunk_size):
+            # tuples and unsaved instances are inserted, saved instances are updated if they changed
+            inserts = [m for m in chunk if not isinstance(m, cls) or m._id is None]
+            updates = [m for m in chunk if isinstance(m, cls) and m._id is not None and m._dirty]
+            new_ids = iter(bulk_write('magazines',
+                "INSERT INTO magazines (name, category) VALUES (?,?)",
+                [(m._name, m._category) if isinstance(m, cls) else tuple(m) for m in inserts],
+                "UPDATE magazines SET name=?, category=? WHERE id=?",
+                [(m._name, m._category, m._id) for m in updates]))
+            track_instances([m for m in chunk if isinstance(m, cls)])
+            # give the new ids back to the instances and cache them
+            for magazine in chunk:
+                if not isinstance(magazine, cls):
+                    ids.append(next(new_ids))
+                    continue
+                if magazine._id is None:
+                    magazine._id = next(new_ids)
+                magazine._dirty = None
+                cls.identity_map.put(magazine._id, magazine)
+                ids.append(magazine._id)
+        return ids
 
     # relationship method to get all the articles in this magazine
-    def articles(self):
-        conn=get_connection()
-        cursor=conn.cursor()
+    # with a limit it returns a keyset Page of at most limit articles after the after_id cursor instead
+    # rows_only returns lightweight ArticleRow tuples instead of Article objects (also in a Page)
+    # the authors are loaded on first access unless eager=True loads them in the same query
+    def articles(self, limit=None, after_id=None, rows_only=False, eager=False):
+        from .article import Article
+        if limit is not None:
+            return Article.find_page("magazine_id", self._id, limit, after_id, eager, magazines={self._id: self}, rows_only=rows_only)
+        if rows_only:
+            return Article.find_rows("magazine_id=?", (self._id,))
         # find all articles where the magazine id matches this magazine id
-        cursor.execute("SELECT * FROM articles WHERE magazine_id=?", (self._id,))
-        #get all matching rows
-        rows=cursor.fetchall()
-        conn.close()
-        #convert rows to article objects and return them
+        # this magazine instance is reused for every article instead of being looked up per row
+        return Article.find_where("ar.magazine_id=?", (self._id,), eager, magazines={self._id: self})
+
+    # streaming version of articles() that yields articles batch_size rows at a time
+    def iter_articles(self, batch_size=FETCH_BATCH_SIZE, rows_only=False, eager=False):
         from .article import Article
-        return [Article.new_from_db(row) for row in rows]
+        if rows_only:
+            return Article.iter_rows("magazine_id=?", (self._id,), batch_size)
+        return Article.iter_where("ar.magazine_id=?", (self._id,), batch_size, eager, magazines={self._id: self})
 
     #relationship method to get all the authors that have written for this magazine
+    # (memoized until an article or author is written)
+    @cached_result('articles', 'authors')
     def contributors(self):
-        conn=get_connection()
-        cursor=conn.cursor()
-        # find all authors that have written articles for this magazine using a join query
-        cursor.execute('''
-            SELECT DISTINCT a.id, a.name FROM authors a
-            JOIN articles ar ON a.id = ar.author_id
-            WHERE ar.magazine_id=?
-        ''', (self._id,))
-        rows=cursor.fetchall() # get all matching rows
-        conn.close()
+        with checkout() as conn:
+            cursor=conn.cursor()
+            # find all authors that have written articles for this magazine
+            # (author_magazine_counts has one row per author and magazine, so no DISTINCT needed)
+            cursor.execute('''
+                SELECT a.id, a.name FROM author_magazine_counts c
+                JOIN authors a ON a.id = c.author_id
+                WHERE c.magazine_id=?
+            ''', (self._id,))
+            rows=cursor.fetchall() # get all matching rows
         # convert rows to author objects and return them
         from .author import Author
         return [Author.new_from_db(row) for row in rows]
     
-    # method to get all article titles in this magazine
+    # method to get all article titles in this magazine (memoized until an article is written)
+    @cached_result('articles')
     def article_titles(self):
-        conn = get_connection()
-        cursor = conn.cursor()
-        # select only titles from articles in this magazine
-        cursor.execute("SELECT title FROM articles WHERE magazine_id=?", (self._id,))
-        # get all matching rows
-        rows = cursor.fetchall()
-        conn.close()
+        with checkout() as conn:
+            cursor = conn.cursor()
+            # select only titles from articles in this magazine
+            cursor.execute("SELECT title FROM articles WHERE magazine_id=?", (self._id,))
+            # get all matching rows
+            rows = cursor.fetchall()
         # extract titles from rows
         return [row[0] for row in rows]
 
+    # streaming version of article_titles() that yields titles batch_size rows at a time
+    def iter_titles(self, batch_size=FETCH_BATCH_SIZE):
+        for row in iter_rows("SELECT title FROM articles WHERE magazine_id=? ORDER BY id", (self._id,), batch_size):
+            yield row[0]
+
     # method to get authors who wrote more than 2 articles for this magazine
     def contributing_authors(self):
-        conn = get_connection()
-        cursor = conn.cursor()
-        # use GROUP BY and HAVING to find authors with more than 2 articles in this magazine
-        cursor.execute('''
-            SELECT a.id, a.name FROM authors a
-            JOIN articles ar ON a.id = ar.author_id
-            WHERE ar.magazine_id=?
-            GROUP BY a.id
-            HAVING COUNT(ar.id) > 2
-        ''', (self._id,))
-        rows = cursor.fetchall()  # get all matching rows
-        conn.close()
+        with checkout() as conn:
+            cursor = conn.cursor()
+            # read the per author counts kept by the triggers instead of grouping the articles table
+            cursor.execute('''
+                SELECT a.id, a.name FROM author_magazine_counts c
+                JOIN authors a ON a.id = c.author_id
+                WHERE c.magazine_id=? AND c.article_count > 2
+            ''', (self._id,))
+            rows = cursor.fetchall()  # get all matching rows
         # convert rows to author objects and return them
         from .author import Author
         return [Author.new_from_db(row) for row in rows]
+
+    # class method mapping every magazine id to its authors with at least min_articles articles,
+    # computed in one pass over author_magazine_counts instead of one contributing_authors() query per magazine
+    @classmethod
+    def all_contributing_authors(cls, min_articles=3):
+        with checkout() as conn:
+            rows = conn.execute('''
+                SELECT c.magazine_id, a.id, a.name FROM author_magazine_counts c
+                JOIN authors a ON a.id = c.author_id
+                WHERE c.article_count >= ?
+                ORDER BY c.magazine_id, a.id
+            ''', (min_articles,)).fetchall()
+        return cls._authors_by_magazine(rows)
+
+    # class method mapping every magazine id to all the authors that have written for it
+    @classmethod
+    def all_contributors(cls):
+        with checkout() as conn:
+            rows = conn.execute('''
+                SELECT c.magazine_id, a.id, a.name FROM author_magazine_counts c
+                JOIN authors a ON a.id = c.author_id
+                ORDER BY c.magazine_id, a.id
+            ''').fetchall()
+        return cls._authors_by_magazine(rows)
+
+    # group (magazine_id, author_id, author_name) rows into magazine id -> list of authors
+    @staticmethod
+    def _authors_by_magazine(rows):
+        from .author import Author
+        authors = {}
+        result = {}
+        for magazine_id, author_id, author_name in rows:
+            # each author is hydrated once however many magazines it appears in
+            author = authors.get(author_id)
+            if author is None:
+                author = authors[author_id] = Author.new_from_db((author_id, author_name))
+            result.setdefault(magazine_id, []).append(author)
+        return result
+
+    # class method mapping every magazine id to its number of articles (0 for magazines without any)
+    @classmethod
+    def article_counts(cls):
+        with checkout() as conn:
+            rows = conn.execute('''
+                SELECT m.id, COALESCE(c.article_count, 0) FROM magazines m
+                LEFT JOIN magazine_article_counts c ON c.magazine_id = m.id
+            ''').fetchall()
+        return dict(rows)
+
+    # class method returning the magazine with the most articles (lowest id wins a tie), or None
+    @classmethod
+    def top_publisher(cls):
+        with checkout() as conn:
+            row = conn.execute('''
+                SELECT m.id, m.name, m.category FROM magazine_article_counts c
+                JOIN magazines m ON m.id = c.magazine_id
+                ORDER BY c.article_count DESC, m.id
+                LIMIT 1
+            ''').fetchone()
+        return cls.new_from_db(row)
+
+    # async versions of the methods above for asyncio code, run on the db executor (lib/aio.py)
+    @classmethod
+    async def afind_by_id(cls, id):
+        return await run_in_db(cls.find_by_id, id)
+
+    @classmethod
+    async def afind_by_ids(cls, ids):
+        return await run_in_db(cls.find_by_ids, list(ids))
+
+    @classmethod
+    async def asave_many(cls, magazines, *args, **kwargs):
+        return await run_in_db(cls.save_many, list(magazines), *args, **kwargs)
+
+    async def asave(self):
+        return await run_in_db(self.save)
+
+    async def aarticles(self, *args, **kwargs):
+        return await run_in_db(self.articles, *args, **kwargs)
+
+    async def acontributors(self):
+        return await run_in_db(self.contributors)
+
+    async def aarticle_titles(self):
+        return await run_in_db(self.article_titles)
+
+    async def acontributing_authors(self):
+        return await run_in_db(self.contributing_authors)
+
     # string representation of the magazine for debugging and printing
     def __repr__(self):
         return f'<Magazine id={self._id} name={self._name} category={self._category}>'
\ No newline at end of file
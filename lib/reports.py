@@ -0,0 +1,154 @@
+# parallel analytics reports: the work is split into id ranges that run on a process pool,
+# each worker process reading the db file through its own read-only connection
+# the partial results are merged in range order and sorted, so the output never depends on scheduling
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+from . import database_utils
+
+# number of id ranges per worker, more ranges than workers keeps every worker busy when ranges are uneven
+RANGES_PER_WORKER=4
+
+# read-only connection of this worker process (set by _init_worker)
+_worker_conn=None
+
+# open the db file read-only, so a report can never write to it
+def _connect_read_only(db_file):
+    return sqlite3.connect(f'file:{os.path.abspath(db_file)}?mode=ro', uri=True)
+
+def _init_worker(db_file):
+    global _worker_conn
+    _worker_conn=_connect_read_only(db_file)
+
+# magazine id -> number of distinct authors, for magazines with ids in [low, high]
+def _contributor_counts(conn,low,high):
+    return conn.execute('''
+        SELECT m.id, m.name, m.category, COUNT(c.author_id) FROM magazines m
+        LEFT JOIN author_magazine_counts c ON c.magazine_id = m.id
+        WHERE m.id BETWEEN ? AND ?
+        GROUP BY m.id
+    ''', (low, high)).fetchall()
+
+# (author id, name, categories) for authors with ids in [low, high] writing in at least min_categories categories
+def _category_reach(conn,low,high,min_categories=2):
+    rows=conn.execute('''
+        SELECT a.id, a.name, m.category FROM author_magazine_counts c
+        JOIN authors a ON a.id = c.author_id
+        JOIN magazines m ON m.id = c.magazine_id
+        WHERE c.author_id BETWEEN ? AND ?
+    ''', (low, high)).fetchall()
+    categories={}
+    names={}
+    for author_id,name,category in rows:
+        categories.setdefault(author_id,set()).add(category)
+        names[author_id]=name
+    return [(author_id, names[author_id], sorted(found))
+            for author_id,found in categories.items() if len(found)>=min_categories]
+
+# (magazine id, author id, name) for authors with at least min_articles articles in magazines with ids in [low, high]
+def _contributing_authors(conn,low,high,min_articles=3):
+    return conn.execute('''
+        SELECT c.magazine_id, a.id, a.name FROM author_magazine_counts c
+        JOIN authors a ON a.id = c.author_id
+        WHERE c.magazine_id BETWEEN ? AND ? AND c.article_count >= ?
+    ''', (low, high, min_articles)).fetchall()
+
+# merge steps, given the partial results in range order and the report parameters
+
+def _merge_top_magazines(parts,limit=10,**params):
+    rows=[row for part in parts for row in part]
+    # most contributors first, lowest id wins a tie
+    rows.sort(key=lambda row: (-row[3], row[0]))
+    return rows[:limit]
+
+def _merge_category_reach(parts,**params):
+    rows=[row for part in parts for row in part]
+    # widest reach first, lowest id wins a tie
+    rows.sort(key=lambda row: (-len(row[2]), row[0]))
+    return rows
+
+def _merge_contributing_authors(parts,**params):
+    result={}
+    for magazine_id,author_id,name in sorted(row for part in parts for row in part):
+        result.setdefault(magazine_id,[]).append((author_id,name))
+    return result
+
+# report name -> (table whose ids are split, worker function, names of its parameters, merge function)
+REPORTS={
+    'top-magazines': ('magazines', _contributor_counts, (), _merge_top_magazines),
+    'cross-category-authors': ('authors', _category_reach, ('min_categories',), _merge_category_reach),
+    'contributing-authors': ('magazines', _contributing_authors, ('min_articles',), _merge_contributing_authors),
+}
+
+# split the ids of table into at most parts contiguous [low, high] ranges
+def id_ranges(conn,table,parts):
+    low,high=conn.execute(f"SELECT MIN(id), MAX(id) FROM {table}").fetchone()
+    if low is None:
+        return []
+    parts=max(1,min(parts,high-low+1))
+    step=(high-low+1)/parts
+    bounds=[low+round(step*i) for i in range(parts+1)]
+    return [(bounds[i], bounds[i+1]-1) for i in range(parts)]
+
+# runs in a worker process
+def _run_range(worker,low,high,params):
+    return worker(_worker_conn,low,high,**params)
+
+# run the named report (see REPORTS) on the current DB_FILE with workers processes and return the merged result
+# workers=1 runs it in this process, which is also the baseline to measure the speedup against
+def run_report(name,workers=None,ranges=None,**params):
+    if name not in REPORTS:
+        raise ValueError(f'unknown report {name!r}, expected one of {", ".join(REPORTS)}')
+    db_file=database_utils.DB_FILE
+    if db_file.startswith('file:'):
+        raise ValueError('reports need a database file, in-memory databases cannot be shared with worker processes')
+    table,worker,param_names,merge=REPORTS[name]
+    worker_params={key: params[key] for key in param_names if key in params}
+    workers=workers or os.cpu_count() or 1
+    conn=_connect_read_only(db_file)
+    try:
+        bounds=id_ranges(conn,table,ranges or workers*RANGES_PER_WORKER)
+        if workers==1:
+            parts=[worker(conn,low,high,**worker_params) for low,high in bounds]
+    finally:
+        conn.close()
+    if workers>1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(db_file,)) as pool:
+            futures=[pool.submit(_run_range,worker,low,high,worker_params) for low,high in bounds]
+            # collected in range order whichever worker finishes first
+            parts=[future.result() for future in futures]
+    return merge(parts,**params)
+
+# magazines with the most distinct authors as (id, name, category, contributor count) rows
+def top_magazines(limit=10,workers=None):
+    return run_report('top-magazines',workers,limit=limit)
+
+# authors writing in at least min_categories categories as (id, name, sorted categories) rows
+def cross_category_authors(min_categories=2,workers=None):
+    return run_report('cross-category-authors',workers,min_categories=min_categories)
+
+# magazine id -> [(author id, name)] of the authors with at least min_articles articles in it
+# (the same authors as Magazine.all_contributing_authors, as plain tuples)
+def contributing_authors(min_articles=3,workers=None):
+    return run_report('contributing-authors',workers,min_articles=min_articles)
+
+# command line entry point: python -m lib.reports top-magazines --db magazine.db --workers 8
+def main(argv=None):
+    import argparse
+    import time
+    parser=argparse.ArgumentParser(description='Parallel analytics reports')
+    parser.add_argument('report', choices=REPORTS)
+    parser.add_argument('--db', default=database_utils.DB_FILE, help='database file (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: cpu count)')
+    args=parser.parse_args(argv)
+    database_utils.DB_FILE=args.db
+    start=time.perf_counter()
+    result=run_report(args.report,args.workers)
+    rows=result.items() if isinstance(result,dict) else result
+    for row in rows:
+        print(*row, sep='\t')
+    print(f'{args.report}: {len(result)} rows in {time.perf_counter()-start:.2f}s')
+
+if __name__=='__main__':
+    main()
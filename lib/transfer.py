@@ -0,0 +1,148 @@
+# streaming import/export of authors, magazines and articles as csv or jsonl files
+# rows are read and written one at a time and imported in chunked transactions,
+# so file size is not limited by memory
+import csv
+import json
+import sys
+import time
+
+from .database_utils import chunked, iter_rows, rows_by_ids, BULK_CHUNK_SIZE
+from .author import Author
+from .magazine import Magazine
+from .article import Article
+
+# what can be exported: name -> (column names, query)
+EXPORTS={
+    'authors': (['id', 'name'], "SELECT id, name FROM authors ORDER BY id"),
+    'magazines': (['id', 'name', 'category'], "SELECT id, name, category FROM magazines ORDER BY id"),
+    # articles refer to their author and magazine by name so the file can be imported elsewhere
+    'articles': (['id', 'title', 'author', 'magazine'], '''
+        SELECT ar.id, ar.title, au.name, m.name FROM articles ar
+        LEFT JOIN authors au ON au.id = ar.author_id
+        LEFT JOIN magazines m ON m.id = ar.magazine_id
+        ORDER BY ar.id'''),
+    'author_magazines': (['author', 'magazine', 'article_count'], '''
+        SELECT au.name, m.name, c.article_count FROM author_magazine_counts c
+        JOIN authors au ON au.id = c.author_id
+        JOIN magazines m ON m.id = c.magazine_id
+        ORDER BY c.author_id, c.magazine_id'''),
+}
+
+# file format from the extension
+def _format(path,fmt=None):
+    fmt=fmt or path.rsplit('.',1)[-1].lower()
+    if fmt not in ('csv','jsonl'):
+        raise ValueError(f'unknown file format {fmt!r}, expected csv or jsonl')
+    return fmt
+
+# prints rows/sec to stderr every `every` rows and at the end
+class Progress:
+    def __init__(self,label,every=100_000,stream=None):
+        self.label=label
+        self.every=every
+        self.stream=stream
+        self.rows=0
+        self.start=time.perf_counter()
+
+    def add(self,rows):
+        before=self.rows
+        self.rows+=rows
+        if self.every and self.rows//self.every>before//self.every:
+            self.report()
+
+    def report(self):
+        elapsed=time.perf_counter()-self.start
+        rate=self.rows/elapsed if elapsed else 0
+        print(f'{self.label}: {self.rows:,} rows ({rate:,.0f} rows/s)', file=self.stream or sys.stderr)
+
+# stream dict records from a csv (with a header row) or jsonl file
+def read_records(path,fmt=None):
+    fmt=_format(path,fmt)
+    with open(path,newline='',encoding='utf-8') as f:
+        if fmt=='csv':
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+# name -> id for the given names, looked up in chunks and remembered in known
+def _resolve(table,names,known):
+    missing=[name for name in names if name not in known]
+    # highest id first so the oldest row wins when a name is not unique
+    rows=rows_by_ids(f"SELECT name, id FROM {table} WHERE name IN ({{ids}}) ORDER BY id DESC", missing)
+    for name,row in rows.items():
+        known[name]=row[1]
+
+# insert the records of kind (authors, magazines or articles) from path and return the row count
+# authors and magazines whose name already exists are skipped, so re-importing is safe
+# articles name their author and magazine (author/magazine columns) or give author_id/magazine_id
+def import_file(kind,path,fmt=None,chunk_size=BULK_CHUNK_SIZE,progress=None):
+    progress=progress or Progress(f'import {kind}')
+    # name -> id cache for resolving article authors and magazines
+    known={}
+    for chunk in chunked(read_records(path,fmt),chunk_size):
+        if kind=='authors':
+            # names seen in earlier chunks are committed by now, so the db lookup skips them
+            # and only this chunk's names are held in memory
+            seen={}
+            _resolve('authors',[r['name'] for r in chunk],seen)
+            rows=_new_by_name(chunk,seen,lambda r: (r['name'],))
+            Author.save_many(rows,chunk_size)
+        elif kind=='magazines':
+            seen={}
+            _resolve('magazines',[r['name'] for r in chunk],seen)
+            rows=_new_by_name(chunk,seen,lambda r: (r['name'], r['category']))
+            Magazine.save_many(rows,chunk_size)
+        elif kind=='articles':
+            Article.bulk_create(_article_rows(chunk,known),chunk_size)
+        else:
+            raise ValueError(f'cannot import {kind!r}, expected authors, magazines or articles')
+        progress.add(len(chunk))
+    progress.report()
+    return progress.rows
+
+# rows for records whose name is not in the db yet (nor earlier in the file)
+def _new_by_name(records,known,to_row):
+    rows=[]
+    for record in records:
+        if record['name'] not in known:
+            known[record['name']]=None
+            rows.append(to_row(record))
+    return rows
+
+# (title, author_id, magazine_id) rows for article records, resolving names to ids
+def _article_rows(records,known):
+    authors=known.setdefault('authors',{})
+    magazines=known.setdefault('magazines',{})
+    _resolve('authors',[r['author'] for r in records if not r.get('author_id') and r.get('author')],authors)
+    _resolve('magazines',[r['magazine'] for r in records if not r.get('magazine_id') and r.get('magazine')],magazines)
+    rows=[]
+    for record in records:
+        author_id=record.get('author_id') or authors.get(record.get('author'))
+        magazine_id=record.get('magazine_id') or magazines.get(record.get('magazine'))
+        if author_id is None or magazine_id is None:
+            raise ValueError(f'unknown author or magazine for article {record.get("title")!r}')
+        rows.append((record['title'],int(author_id),int(magazine_id)))
+    return rows
+
+# stream the export called name (see EXPORTS) to path and return the row count
+def export_file(name,path,fmt=None,progress=None):
+    if name not in EXPORTS:
+        raise ValueError(f'cannot export {name!r}, expected one of {", ".join(EXPORTS)}')
+    fmt=_format(path,fmt)
+    columns,sql=EXPORTS[name]
+    progress=progress or Progress(f'export {name}')
+    with open(path,'w',newline='',encoding='utf-8') as f:
+        if fmt=='csv':
+            writer=csv.writer(f)
+            writer.writerow(columns)
+            write=writer.writerow
+        else:
+            write=lambda row: f.write(json.dumps(dict(zip(columns,row)))+'\n')
+        for rows in chunked(iter_rows(sql),BULK_CHUNK_SIZE):
+            for row in rows:
+                write(row)
+            progress.add(len(rows))
+    progress.report()
+    return progress.rows
@@ -0,0 +1,182 @@
+# optional single writer: one thread runs every model save() and group commits them
+# concurrent save() calls then queue up instead of fighting over sqlite's write lock,
+# and many small writes share one transaction (one fsync) instead of one each
+import atexit
+import contextvars
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from . import database_utils
+
+# max number of writes committed in one transaction
+WRITE_BATCH_SIZE=500
+
+# max seconds the writer waits for more writes after the first one of a batch
+WRITE_MAX_LATENCY=0.002
+
+# marks the end of the queue
+_STOP=object()
+
+class WriteQueue:
+    def __init__(self,max_batch=WRITE_BATCH_SIZE,max_latency=WRITE_MAX_LATENCY):
+        self.max_batch=max_batch
+        self.max_latency=max_latency
+        # (db file, tables, sql, params, future, caller context) waiting to be written
+        self._queue=queue.Queue()
+        # the writer's own connections, one per db file
+        self._connections={}
+        # counters used to tune the batch size and latency
+        self.writes=0
+        self.batches=0
+        self.errors=0
+        self._thread=threading.Thread(target=self._run, name='db-writer', daemon=True)
+        self._thread.start()
+
+    # queue one statement and return a future for its lastrowid
+    # tables are the tables it writes, their cached results are invalidated once it is committed
+    def submit(self,tables,sql,params=()):
+        future=Future()
+        self._queue.put((database_utils.DB_FILE, tables, sql, params, future, contextvars.copy_context()))
+        return future
+
+    # write everything still queued, then stop the thread and close its connections
+    def stop(self):
+        self._queue.put(_STOP)
+        self._thread.join()
+        for conn in self._connections.values():
+            conn._close()
+        self._connections.clear()
+
+    def _run(self):
+        stopping=False
+        while not stopping:
+            item=self._queue.get()
+            if item is _STOP:
+                break
+            batch=[item]
+            # collect more writes until the batch is full or the latency budget is spent
+            deadline=time.monotonic()+self.max_latency
+            while len(batch)<self.max_batch:
+                try:
+                    item=self._queue.get(timeout=max(deadline-time.monotonic(),0))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping=True
+                    break
+                batch.append(item)
+            # writes meant for different db files get a transaction each
+            by_db={}
+            for item in batch:
+                by_db.setdefault(item[0],[]).append(item)
+            for db_file,items in by_db.items():
+                self._commit(db_file,items)
+
+    def _connection(self,db_file):
+        conn=self._connections.get(db_file)
+        if conn is None:
+            conn=self._connections[db_file]=database_utils._open_connection(db_file)
+        return conn
+
+    # run the items in one transaction, each in a savepoint so a failing write only fails its own future
+    def _commit(self,db_file,items):
+        results=[]
+        tables=set()
+        try:
+            conn=self._connection(db_file)
+            conn.execute("BEGIN IMMEDIATE")
+            for _,item_tables,sql,params,future,context in items:
+                # skip writes whose caller cancelled the future
+                if not future.set_running_or_notify_cancel():
+                    continue
+                conn.execute("SAVEPOINT write")
+                try:
+                    # in the caller's context so its capture() blocks see the statement
+                    row_id=context.run(conn.execute,sql,params).lastrowid
+                except Exception as e:
+                    conn.execute("ROLLBACK TO write")
+                    conn.execute("RELEASE write")
+                    results.append((future,e,None))
+                    continue
+                conn.execute("RELEASE write")
+                tables.update(item_tables)
+                results.append((future,None,row_id))
+            conn.commit()
+        except Exception as e:
+            # the whole transaction failed (e.g. the db is locked by another process)
+            if db_file in self._connections and self._connections[db_file].in_transaction:
+                self._connections[db_file].rollback()
+            results=[(item[4],e,None) for item in items if item[4].running() or item[4].set_running_or_notify_cancel()]
+            tables=set()
+        # cached results must not outlive the committed writes
+        if tables:
+            database_utils.bump_generations(tables,db_file)
+        self.batches+=1
+        for future,error,row_id in results:
+            self.writes+=1
+            if error is None:
+                future.set_result(row_id)
+            else:
+                self.errors+=1
+                future.set_exception(error)
+
+    # snapshot of the counters
+    def stats(self):
+        return {
+            'queued': self._queue.qsize(),
+            'writes': self.writes,
+            'batches': self.batches,
+            'errors': self.errors,
+            'writes_per_batch': self.writes/self.batches if self.batches else 0.0,
+        }
+
+_writer=None
+_writer_lock=threading.Lock()
+
+# route model saves through a single writer thread from now on
+def enable_write_queue(max_batch=WRITE_BATCH_SIZE,max_latency=WRITE_MAX_LATENCY):
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer=WriteQueue(max_batch,max_latency)
+    return _writer
+
+# flush the queue and go back to writing on the caller's own connection
+def disable_write_queue():
+    global _writer
+    with _writer_lock:
+        writer,_writer=_writer,None
+    if writer is not None:
+        writer.stop()
+
+atexit.register(disable_write_queue)
+
+# the running write queue, or None when it is disabled
+def get_write_queue():
+    return _writer
+
+# run one model write (sql on table) and return its lastrowid
+# goes through the write queue when it is enabled, except inside a session(),
+# whose transaction already holds the write lock on this thread's connection
+def write(table,sql,params=()):
+    conn=database_utils.get_connection()
+    writer=_writer
+    if writer is not None and not conn.in_transaction:
+        conn.close()
+        return writer.submit((table,),sql,params).result()
+    try:
+        cursor=conn.execute(sql,params)
+        # invalidate cached results computed from the table
+        database_utils.mark_written(conn,table)
+        conn.commit()
+    except BaseException:
+        # a failed write must not leave this thread's connection in an open transaction holding
+        # the write lock (inside a session() the session rolls back instead)
+        if conn.session_depth==0 and conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return cursor.lastrowid
@@ -11,19 +11,24 @@ from lib.article import Article
 def setup_isolated_db(tmp_path, monkeypatch):
     """
     Use a temporary SQLite database for each test to ensure isolation.
-    Patches the DB_FILE used by get_connection and creates tables.
+    Patches the DB_FILE used by get_connection and copies in the pre-built
+    schema template instead of running the migrations for every test.
     """
     db_path = tmp_path / "test_magazine.db"
+    database_utils.copy_database(database_utils.schema_template(), str(db_path))
     monkeypatch.setattr(database_utils, "DB_FILE", str(db_path))
-    create_tables()
     yield
+    database_utils.close_connections()
 
 
 # ----------------------
 # Database setup tests
 # ----------------------
 
-def test_create_tables_creates_expected_tables():
+def test_create_tables_creates_expected_tables(tmp_path, monkeypatch):
+    # a fresh file, the fixture's database is copied from the already migrated template
+    monkeypatch.setattr(database_utils, "DB_FILE", str(tmp_path / "fresh.db"))
+    create_tables()
     conn = get_connection()
     cur = conn.cursor()
     cur.execute("SELECT name FROM sqlite_master WHERE type='table' ORDER BY name;")
@@ -33,6 +38,66 @@ def test_create_tables_creates_expected_tables():
     assert {"articles", "authors", "magazines"}.issubset(tables)
 
 
+def test_get_connection_reuses_pooled_connection_with_pragmas():
+    conn = get_connection()
+    conn.close()
+    # the same thread gets the same connection back after close()
+    assert get_connection() is conn
+
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert conn.execute("PRAGMA foreign_keys").fetchone()[0] == 1
+
+
+def test_model_reads_do_not_discard_the_callers_open_transaction():
+    conn = get_connection()
+    conn.execute("INSERT INTO authors(name) VALUES ('raw')")
+    # the model read checks the same connection out and back in
+    Author.find_by_ids([5])
+    assert conn.in_transaction
+    conn.commit()
+    conn.close()
+    assert [row[0] for row in get_connection().execute("SELECT name FROM authors")] == ["raw"]
+
+    # closing the outermost checkout still throws an unfinished transaction away
+    conn.execute("INSERT INTO authors(name) VALUES ('unfinished')")
+    conn.close()
+    assert not conn.in_transaction
+    assert [row[0] for row in get_connection().execute("SELECT name FROM authors")] == ["raw"]
+
+
+def test_failed_model_reads_give_their_checkout_back():
+    import sqlite3
+    conn = get_connection()
+    conn.close()
+    # an fts5 syntax error raised between checkout and close
+    with pytest.raises(sqlite3.OperationalError):
+        Article.search("foo AND", raw=True)
+    assert conn.checkouts == 0
+
+    # so close() still throws an abandoned write away and the next save does not commit it
+    conn = get_connection()
+    conn.execute("INSERT INTO authors(name) VALUES ('abandoned')")
+    conn.close()
+    Author("next").save()
+    with database_utils.checkout() as conn:
+        assert [row[0] for row in conn.execute("SELECT name FROM authors")] == ["next"]
+
+
+def test_connections_of_finished_threads_are_closed():
+    import gc
+    from concurrent.futures import ThreadPoolExecutor
+
+    def read(_):
+        with database_utils.checkout() as conn:
+            return conn.execute("SELECT COUNT(*) FROM authors").fetchone()[0]
+
+    for _ in range(3):
+        with ThreadPoolExecutor(max_workers=20) as pool:
+            assert list(pool.map(read, range(40))) == [0] * 40
+    gc.collect()
+    assert [key for key in database_utils._pool if key[1] == database_utils.DB_FILE] == []
+
+
 # ----------------------
 # Author tests
 # ----------------------
@@ -199,3 +264,829 @@ def test_author_and_magazine_relationships_and_helpers():
     # add one more article for a1 in m1 to push over threshold
     Article("T5", a1, m1).save()
     assert {auth.name for auth in m1.contributing_authors()} == {"Author One"}
+
+
+def test_relationship_articles_share_hydrated_instances():
+    a1 = Author("Author One")
+    a1.save()
+    m1 = Magazine("Mag One", "Cat1")
+    m1.save()
+    m2 = Magazine("Mag Two", "Cat2")
+    m2.save()
+
+    Article("T1", a1, m1).save()
+    Article("T2", a1, m1).save()
+    Article("T3", a1, m2).save()
+
+    # the author's articles all point at the author itself, repeated magazines are one object
+    articles = a1.articles()
+    assert [art.title for art in articles] == ["T1", "T2", "T3"]
+    assert all(art.author is a1 for art in articles)
+    assert articles[0].magazine is articles[1].magazine
+    assert articles[2].magazine.name == "Mag Two"
+
+    # the magazine's articles all point at the magazine itself and share the author
+    m1_articles = m1.articles()
+    assert all(art.magazine is m1 for art in m1_articles)
+    assert m1_articles[0].author is m1_articles[1].author
+
+
+def test_identity_map_returns_same_instance_and_counts():
+    from lib.cache import IdentityMap
+
+    author = Author("Alice")
+    author.save()
+    Author.identity_map.clear()
+
+    first = Author.find_by_id(author.id)
+    second = Author.find_by_id(author.id)
+    assert first is second
+    stats = Author.identity_map.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+    # save() makes the saved instance the cached one
+    mag = Magazine("Tech Today", "Technology")
+    mag.save()
+    assert Magazine.find_by_id(mag.id) is mag
+
+    # LRU eviction once the size bound is hit
+    cache = IdentityMap(maxsize=2)
+    cache.put(1, "a")
+    cache.put(2, "b")
+    cache.get(1)
+    cache.put(3, "c")
+    assert cache.get(2) is None
+    assert cache.get(1) == "a"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_bulk_save_assigns_ids_in_input_order(capsys):
+    authors = [Author(f"Author {i}") for i in range(5)]
+    author_ids = Author.save_many(authors + [("Tuple Author",)], chunk_size=2)
+    assert author_ids == [a.id for a in authors] + [authors[-1].id + 1]
+    assert Author.find_by_id(author_ids[-1]).name == "Tuple Author"
+
+    mag_ids = Magazine.save_many([Magazine("Mag One", "Cat1"), ("Mag Two", "Cat2")])
+    assert Magazine.find_by_id(mag_ids[1]).category == "Cat2"
+
+    article = Article("T1", authors[0], Magazine.find_by_id(mag_ids[0]))
+    article_ids = Article.bulk_create([article, ("T2", author_ids[1], mag_ids[1])])
+    assert article.id == article_ids[0]
+    assert Article.find_by_id(article_ids[1]).author.name == "Author 1"
+
+    # no per-row prints from the bulk paths
+    assert "created new" not in capsys.readouterr().out
+
+
+def test_session_commits_once_and_rolls_back_on_error():
+    from lib.database_utils import session
+
+    with session():
+        author = Author("Alice")
+        author.save()
+        mag = Magazine("Mag One", "Cat1")
+        mag.save()
+        author.add_article("T1", mag)
+        # nested block is a savepoint: its failure only undoes its own writes
+        with pytest.raises(RuntimeError):
+            with session():
+                Article("T2", author, mag).save()
+                raise RuntimeError("boom")
+
+    count = get_connection().execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+    assert count == 1
+
+    with pytest.raises(RuntimeError):
+        with session():
+            Author("Bob").save()
+            raise RuntimeError("boom")
+    names = [row[0] for row in get_connection().execute("SELECT name FROM authors")]
+    assert names == ["Alice"]
+
+
+def test_session_rollback_restores_saved_instances(capsys):
+    from lib.database_utils import session
+
+    # a rolled back insert gives its id back and leaves no phantom in the identity map
+    with pytest.raises(RuntimeError):
+        with session():
+            ghost = Author("Rolled back")
+            ghost.save()
+            raise RuntimeError("boom")
+    assert ghost.id is None
+    real_id = Author.save_many([("Real",)])[0]
+    assert Author.find_by_id(real_id).name == "Real"
+    # saving again really writes it
+    ghost.save()
+    assert ghost.id is not None and Author.find_by_id(ghost.id) is ghost
+
+    # a rolled back savepoint leaves its updates dirty and its bulk inserts unsaved
+    mag = Magazine("Mag One", "Cat1")
+    mag.save()
+    with session():
+        with pytest.raises(RuntimeError):
+            with session():
+                mag.category = "Science"
+                mag.save()
+                articles = [Article("T1", ghost, mag), Article("T2", ghost, mag)]
+                Article.bulk_create(articles)
+                raise RuntimeError("boom")
+    assert [a.id for a in articles] == [None, None]
+    assert get_connection().execute("SELECT category FROM magazines").fetchone()[0] == "Cat1"
+    # the identity map does not hand out the rolled back values either
+    assert Magazine.find_by_id(mag.id).category == "Cat1"
+    mag.save()
+    Article.bulk_create(articles)
+    assert get_connection().execute("SELECT category FROM magazines").fetchone()[0] == "Science"
+    assert [a.title for a in mag.articles()] == ["T1", "T2"]
+    assert Magazine.find_by_id(mag.id) is mag
+
+    # the same for an update rolled back with the whole session
+    with pytest.raises(RuntimeError):
+        with session():
+            mag.category = "Rolled back"
+            mag.save()
+            raise RuntimeError("boom")
+    assert Magazine.find_by_id(mag.id).category == "Science"
+
+
+def test_migrations_add_indexes_and_are_idempotent():
+    from lib.database_utils import MIGRATIONS, migrate, schema_version
+
+    assert schema_version() == len(MIGRATIONS)
+    indexes = {row[0] for row in get_connection().execute(
+        "SELECT name FROM sqlite_master WHERE type='index' AND tbl_name='articles'")}
+    assert {"idx_articles_magazine_author", "idx_articles_author_magazine"} <= indexes
+
+    # running again on a current schema changes nothing
+    assert migrate() == len(MIGRATIONS)
+
+    plan = get_connection().execute(
+        "EXPLAIN QUERY PLAN SELECT author_id FROM articles WHERE magazine_id=?", (1,)).fetchall()
+    assert "idx_articles_magazine_author" in plan[0][-1]
+
+    # the importer resolves names through the name indexes
+    for table in ("authors", "magazines"):
+        plan = get_connection().execute(
+            f"EXPLAIN QUERY PLAN SELECT name, id FROM {table} WHERE name IN (?, ?) ORDER BY id DESC", ("a", "b")).fetchall()
+        assert any(f"idx_{table}_name" in row[-1] for row in plan)
+
+
+def test_streaming_iterators_match_list_methods():
+    author = Author("Alice")
+    author.save()
+    mag = Magazine("Mag One", "Cat1")
+    mag.save()
+    Article.bulk_create([(f"T{i}", author.id, mag.id) for i in range(7)])
+
+    streamed = mag.iter_articles(batch_size=3)
+    assert not isinstance(streamed, list)
+    assert [art.title for art in streamed] == [art.title for art in mag.articles()]
+    assert all(art.author is author for art in author.iter_articles(batch_size=2))
+    assert list(mag.iter_titles(batch_size=2)) == [f"T{i}" for i in range(7)]
+
+
+def test_keyset_pagination_walks_all_pages():
+    author = Author("Alice")
+    author.save()
+    mag = Magazine("Mag One", "Cat1")
+    mag.save()
+    Article.bulk_create([(f"T{i}", author.id, mag.id) for i in range(5)])
+
+    titles, after_id, pages = [], None, 0
+    while True:
+        page = mag.articles(limit=2, after_id=after_id)
+        titles.extend(art.title for art in page.articles)
+        pages += 1
+        after_id = page.next_after_id
+        if after_id is None:
+            break
+    assert titles == [f"T{i}" for i in range(5)]
+    assert pages == 3
+
+    page = author.articles(limit=10)
+    assert len(page.articles) == 5 and page.next_after_id is None
+
+    with pytest.raises(ValueError):
+        mag.articles(limit=0)
+
+
+def test_find_by_ids_returns_input_order_and_uses_cache():
+    ids = Author.save_many([(f"Author {i}",) for i in range(5)])
+    Author.identity_map.clear()
+    cached = Author.find_by_id(ids[2])
+
+    found = Author.find_by_ids([ids[4], 9999, ids[2], ids[0], ids[4]])
+    assert [a.name if a else None for a in found] == ["Author 4", None, "Author 2", "Author 0", "Author 4"]
+    assert found[2] is cached
+    assert found[0] is found[4]
+
+    mag_ids = Magazine.save_many([("Mag One", "Cat1"), ("Mag Two", "Cat2")])
+    assert [m.name for m in Magazine.find_by_ids(reversed(mag_ids))] == ["Mag Two", "Mag One"]
+
+    article_ids = Article.bulk_create([("T1", ids[0], mag_ids[0]), ("T2", ids[1], mag_ids[1])])
+    articles = Article.find_by_ids([article_ids[1], article_ids[0]])
+    assert [a.title for a in articles] == ["T2", "T1"]
+    assert articles[1].author.name == "Author 0"
+
+
+def test_slots_models_and_rows_only_mode():
+    from lib.article import ArticleRow
+
+    author = Author("Alice")
+    author.save()
+    mag = Magazine("Mag One", "Cat1")
+    mag.save()
+    Article.bulk_create([("T1", author.id, mag.id), ("T2", author.id, mag.id)])
+
+    # no per-instance __dict__
+    for obj in (author, mag, mag.articles()[0]):
+        assert not hasattr(obj, "__dict__")
+
+    rows = mag.articles(rows_only=True)
+    assert rows == [ArticleRow(rows[0].id, "T1", author.id, mag.id), ArticleRow(rows[1].id, "T2", author.id, mag.id)]
+    assert list(author.iter_articles(rows_only=True, batch_size=1)) == rows
+    # a limit pages through the same rows
+    page = author.articles(limit=1, rows_only=True)
+    assert page.articles == rows[:1] and page.next_after_id == rows[0].id
+    assert mag.articles(limit=2, after_id=page.next_after_id, rows_only=True).articles == rows[1:]
+
+    # hydrated articles keep the read-only title rule
+    with pytest.raises(AttributeError):
+        mag.articles()[0].title = "New"
+
+
+def test_async_facade_matches_sync_api():
+    import asyncio
+
+    async def scenario():
+        author = Author("Alice")
+        await author.asave()
+        mag = Magazine("Mag One", "Cat1")
+        await mag.asave()
+        await Article.abulk_create([("T1", author.id, mag.id), ("T2", author.id, mag.id)])
+        # concurrent calls are spread over the executor threads
+        found, titles, contributors = await asyncio.gather(
+            Author.afind_by_id(author.id), mag.aarticle_titles(), mag.acontributors())
+        page = await mag.aarticles(limit=1)
+        return author, found, titles, contributors, page
+
+    author, found, titles, contributors, page = asyncio.run(scenario())
+    assert found.name == author.name
+    assert titles == ["T1", "T2"]
+    assert [a.name for a in contributors] == ["Alice"]
+    assert page.articles[0].title == "T1" and page.next_after_id is not None
+
+
+def test_benchmark_data_generator_is_seeded_and_skewed(tmp_path):
+    from benchmarks.datagen import generate
+
+    def article_counts(db_file):
+        generate(str(db_file), 500, n_authors=20, n_magazines=5, seed=7)
+        conn = get_connection()
+        return conn.execute(
+            "SELECT author_id, COUNT(*) FROM articles GROUP BY author_id ORDER BY author_id").fetchall()
+
+    first = article_counts(tmp_path / "one.db")
+    assert first == article_counts(tmp_path / "two.db")
+    counts = sorted(count for _, count in first)
+    assert sum(counts) == 500
+    # the most popular author has far more articles than the median one
+    assert counts[-1] > 3 * counts[len(counts) // 2]
+
+
+def test_query_instrumentation_capture_and_slow_log(caplog):
+    from lib import instrumentation
+
+    author = Author("Alice")
+    author.save()
+    mag = Magazine("Mag One", "Cat1")
+    mag.save()
+    Article.bulk_create([("T1", author.id, mag.id), ("T2", author.id, mag.id)])
+
+    with instrumentation.capture() as stats:
+        mag.articles()
+        mag.article_titles()
+    per_caller = stats.by_caller()
+    assert per_caller["Magazine.articles"]["queries"] == 1
+    assert per_caller["Magazine.articles"]["rows"] == 2
+    assert per_caller["Magazine.article_titles"]["rows"] == 2
+    assert stats.count == 2 and stats.connections >= 2
+    assert not instrumentation.active
+
+    instrumentation.set_slow_query_threshold(0)
+    try:
+        with caplog.at_level("WARNING", logger="lib.sql"):
+            mag.contributors()
+    finally:
+        instrumentation.set_slow_query_threshold(None)
+    assert "Magazine.contributors" in caplog.text
+
+
+def test_capture_is_scoped_to_the_capturing_thread_or_task():
+    import asyncio
+    import threading
+    from lib import instrumentation
+
+    author = Author("Alice")
+    author.save()
+    mag = Magazine("Mag One", "Cat1")
+    mag.save()
+    Article.bulk_create([("T1", author.id, mag.id)])
+
+    # a thread's first checkout also runs the connection pragmas, only the queries are counted
+    def selects(stats):
+        return sum(q.sql.lstrip().startswith("SELECT") for q in stats.queries)
+
+    # two threads capturing at the same time only see their own statements
+    barrier = threading.Barrier(2)
+    counts = {}
+    def worker(name, calls):
+        with instrumentation.capture() as stats:
+            barrier.wait()
+            for _ in range(calls):
+                mag.articles()
+            barrier.wait()
+        counts[name] = selects(stats)
+    threads = [threading.Thread(target=worker, args=(n, c)) for n, c in (("a", 1), ("b", 3))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert counts == {"a": 1, "b": 3}
+
+    # concurrent asyncio tasks each see the queries they ran on the db executor
+    async def request(calls):
+        with instrumentation.capture() as stats:
+            for _ in range(calls):
+                await mag.aarticles()
+                await asyncio.sleep(0)
+        return selects(stats)
+    async def main():
+        return await asyncio.gather(request(1), request(2))
+    assert asyncio.run(main()) == [1, 2]
+
+    # the process wide mode is opt-in
+    with instrumentation.capture(all_threads=True) as stats:
+        other = threading.Thread(target=lambda: get_connection().execute("SELECT 1"))
+        other.start()
+        other.join()
+    assert selects(stats) == 1
+    assert not instrumentation.active
+
+
+def test_author_stats_single_aggregate():
+    author = Author("Alice")
+    author.save()
+    other = Author("Bob")
+    other.save()
+    m1, m2, m3 = (Magazine(f"Mag {i}", cat) for i, cat in enumerate(["Cat1", "Cat1", "Cat2"]))
+    for mag in (m1, m2, m3):
+        mag.save()
+    ids = Article.bulk_create([
+        ("T1", author.id, m1.id), ("T2", author.id, m2.id), ("T3", other.id, m3.id),
+        ("T4", author.id, m3.id), ("T5", author.id, m1.id),
+    ])
+
+    assert sorted(author.topic_areas()) == ["Cat1", "Cat2"]
+    assert author.stats() == {
+        "article_count": 4,
+        "magazine_count": 3,
+        "categories": {"Cat1": 3, "Cat2": 1},
+        "first_article_id": ids[0],
+        "last_article_id": ids[4],
+    }
+    assert Author("Nobody").stats()["article_count"] == 0
+
+
+def test_magazine_class_level_analytics():
+    a1, a2 = Author("Author One"), Author("Author Two")
+    Author.save_many([a1, a2])
+    m1, m2, m3 = Magazine("Mag One", "Cat1"), Magazine("Mag Two", "Cat2"), Magazine("Empty", "Cat3")
+    Magazine.save_many([m1, m2, m3])
+    Article.bulk_create(
+        [(f"A{i}", a1.id, m1.id) for i in range(3)]
+        + [(f"B{i}", a2.id, m1.id) for i in range(2)]
+        + [("C", a2.id, m2.id)]
+    )
+
+    assert Magazine.article_counts() == {m1.id: 5, m2.id: 1, m3.id: 0}
+    assert Magazine.top_publisher() is m1
+    assert Magazine.all_contributing_authors() == {m1.id: [a1]}
+    assert Magazine.all_contributing_authors(min_articles=2) == {m1.id: [a1, a2]}
+    assert Magazine.all_contributors() == {m1.id: [a1, a2], m2.id: [a2]}
+    # same answer as the per magazine method
+    assert Magazine.all_contributing_authors().get(m1.id) == m1.contributing_authors()
+
+
+def test_article_search_ranked_and_filtered():
+    from lib.database_utils import rebuild_search_index
+
+    a1, a2 = Author("Author One"), Author("Author Two")
+    Author.save_many([a1, a2])
+    m1, m2 = Magazine("Mag One", "Cat1"), Magazine("Mag Two", "Cat2")
+    Magazine.save_many([m1, m2])
+    Article("Python tips and Python tricks", a1, m1).save()
+    # bulk inserts are indexed by the triggers too
+    Article.bulk_create([("Learning Python", a2.id, m2.id), ("Rust for C++ people", a1.id, m2.id)])
+
+    assert [a.title for a in Article.search("python")] == ["Python tips and Python tricks", "Learning Python"]
+    assert [a.title for a in Article.search("python", magazine=m2)] == ["Learning Python"]
+    assert [a.title for a in Article.search("python", author=a1.id)] == ["Python tips and Python tricks"]
+    # punctuation in the query is not fts5 syntax
+    assert [a.title for a in Article.search("C++")] == ["Rust for C++ people"]
+    assert Article.search("python", limit=1)[0].author is a1
+
+    rebuild_search_index()
+    assert len(Article.search("learning")) == 1
+
+
+def test_aggregate_count_tables_follow_article_writes():
+    from lib.database_utils import check_aggregates, rebuild_aggregates
+
+    a1, a2 = Author("Author One"), Author("Author Two")
+    Author.save_many([a1, a2])
+    m1, m2 = Magazine("Mag One", "Cat1"), Magazine("Mag Two", "Cat2")
+    Magazine.save_many([m1, m2])
+    ids = Article.bulk_create([(f"T{i}", a1.id, m1.id) for i in range(3)] + [("U", a2.id, m2.id)])
+    assert [a.name for a in m1.contributing_authors()] == ["Author One"]
+
+    conn = get_connection()
+    # moving and deleting articles keeps the counts in step
+    conn.execute("UPDATE articles SET magazine_id=? WHERE id=?", (m2.id, ids[0]))
+    conn.execute("DELETE FROM articles WHERE id=?", (ids[3],))
+    conn.commit()
+    assert m1.contributing_authors() == []
+    assert [a.name for a in m2.contributors()] == ["Author One"]
+    assert {m.name for m in a2.magazines()} == set()
+    assert Magazine.article_counts() == {m1.id: 2, m2.id: 1}
+    assert check_aggregates() == {"author_magazine_counts": 0, "magazine_article_counts": 0}
+
+    # a drifted table is detected and repaired
+    conn.execute("DELETE FROM magazine_article_counts")
+    conn.commit()
+    assert check_aggregates()["magazine_article_counts"] == 2
+    rebuild_aggregates()
+    assert check_aggregates()["magazine_article_counts"] == 0
+
+
+def test_article_relations_load_lazily_unless_eager():
+    from lib import instrumentation
+
+    authors = [Author(f"Author {i}") for i in range(3)]
+    Author.save_many(authors)
+    mag = Magazine("Mag One", "Cat1")
+    mag.save()
+    Article.bulk_create([(f"T{i}", authors[i % 3].id, mag.id) for i in range(6)])
+    Author.identity_map.clear()
+
+    # listing titles is a single query whatever the number of articles
+    with instrumentation.capture() as stats:
+        articles = mag.articles()
+        titles = [art.title for art in articles]
+        author_ids = [art.author_id for art in articles]
+    assert stats.count == 1
+    assert titles == [f"T{i}" for i in range(6)]
+    assert author_ids == [authors[i % 3].id for i in range(6)]
+
+    # each distinct author is loaded once, on first access
+    with instrumentation.capture() as stats:
+        names = [art.author.name for art in articles]
+    assert names == [f"Author {i % 3}" for i in range(6)]
+    assert stats.count == 3
+
+    Author.identity_map.clear()
+    with instrumentation.capture() as stats:
+        names = [art.author.name for art in mag.articles(eager=True)]
+    assert stats.count == 1
+    assert names == [f"Author {i % 3}" for i in range(6)]
+
+
+def test_import_export_round_trip(tmp_path, monkeypatch, capsys):
+    from lib.transfer import import_file, export_file
+
+    (tmp_path / "authors.csv").write_text("name\nAlice\nBob\nAlice\n")
+    (tmp_path / "magazines.jsonl").write_text(
+        '{"name": "Mag One", "category": "Cat1"}\n{"name": "Mag Two", "category": "Cat2"}\n')
+    (tmp_path / "articles.csv").write_text(
+        "title,author,magazine\nT1,Alice,Mag One\nT2,Bob,Mag Two\nT3,Alice,Mag Two\n")
+
+    # the second Alice is in another chunk and still not duplicated
+    assert import_file("authors", str(tmp_path / "authors.csv"), chunk_size=2) == 3
+    import_file("magazines", str(tmp_path / "magazines.jsonl"))
+    import_file("articles", str(tmp_path / "articles.csv"), chunk_size=2)
+    # re-importing authors does not duplicate them
+    import_file("authors", str(tmp_path / "authors.csv"))
+    assert [a and a.name for a in Author.find_by_ids([1, 2, 3])] == ["Alice", "Bob", None]
+    assert "rows/s" in capsys.readouterr().err
+
+    export_file("articles", str(tmp_path / "out.csv"))
+    assert (tmp_path / "out.csv").read_text().splitlines() == [
+        "id,title,author,magazine", "1,T1,Alice,Mag One", "2,T2,Bob,Mag Two", "3,T3,Alice,Mag Two"]
+
+    # the export imports cleanly into another database
+    export_file("articles", str(tmp_path / "out.jsonl"))
+    monkeypatch.setattr(database_utils, "DB_FILE", str(tmp_path / "copy.db"))
+    create_tables()
+    import_file("authors", str(tmp_path / "authors.csv"))
+    import_file("magazines", str(tmp_path / "magazines.jsonl"))
+    import_file("articles", str(tmp_path / "out.jsonl"))
+    assert Magazine.find_by_id(2).article_titles() == ["T2", "T3"]
+
+    with pytest.raises(ValueError):
+        (tmp_path / "bad.csv").write_text("title,author,magazine\nT9,Nobody,Mag One\n")
+        import_file("articles", str(tmp_path / "bad.csv"))
+
+
+def test_memory_database_concurrent_writers():
+    import threading
+    from lib.database_utils import use_memory_database, drop_memory_database, schema_template
+
+    use_memory_database("test_mem_writers", template=schema_template())
+    try:
+        author = Author("Alice")
+        author.save()
+        magazine = Magazine("Mag", "Tech")
+        magazine.save()
+        errors = []
+
+        # every save also runs the fts and aggregate triggers, so the writers contend on several tables
+        def writer(n):
+            try:
+                for i in range(50):
+                    Article(f"Title {n} {i}", author, magazine).save()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=writer, args=(n,)) for n in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert errors == []
+        assert len(magazine.article_titles()) == 100
+    finally:
+        drop_memory_database("test_mem_writers")
+
+
+def test_memory_database_with_template_snapshot_and_restore(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+    from lib.database_utils import (use_memory_database, drop_memory_database, schema_template,
+                                    snapshot, restore, MIGRATIONS, schema_version)
+
+    uri = use_memory_database("test_mem", template=schema_template())
+    try:
+        assert database_utils.DB_FILE == uri
+        assert schema_version() == len(MIGRATIONS)
+        author = Author("Alice")
+        author.save()
+        # other threads (with their own pooled connections) see the same data
+        with ThreadPoolExecutor(1) as pool:
+            assert pool.submit(lambda: get_connection().execute("SELECT name FROM authors").fetchall()).result() == [("Alice",)]
+        snapshot(str(tmp_path / "snap.db"))
+    finally:
+        drop_memory_database("test_mem")
+
+    # a dropped database starts out empty, restore brings the snapshot back
+    use_memory_database("test_mem")
+    try:
+        assert get_connection().execute("SELECT name FROM sqlite_master WHERE name='authors'").fetchone() is None
+        restore(str(tmp_path / "snap.db"))
+        assert Author.find_by_id(author.id).name == "Alice"
+    finally:
+        drop_memory_database("test_mem")
+
+
+def test_relationship_result_cache_invalidated_by_writes():
+    from lib import instrumentation
+    from lib.cache import result_cache
+    from lib.database_utils import session
+
+    result_cache.clear()
+    author = Author("Alice")
+    author.save()
+    mag = Magazine("Mag One", "Cat1")
+    mag.save()
+    author.add_article("T1", mag)
+
+    assert mag.article_titles() == ["T1"]
+    with instrumentation.capture() as stats:
+        titles = mag.article_titles()
+        titles.append("not cached")
+        assert mag.article_titles() == ["T1"]
+    assert stats.count == 0
+
+    # any article write invalidates it, including bulk writes and writes inside a session
+    author.add_article("T2", mag)
+    assert mag.article_titles() == ["T1", "T2"]
+    Article.bulk_create([("T3", author.id, mag.id)])
+    assert mag.article_titles() == ["T1", "T2", "T3"]
+    with session():
+        author.add_article("T4", mag)
+        assert mag.article_titles()[-1] == "T4"
+    assert mag.article_titles()[-1] == "T4"
+
+    # a rolled back savepoint drops results cached after its writes
+    with session():
+        with pytest.raises(RuntimeError):
+            with session():
+                author.add_article("T5", mag)
+                assert mag.article_titles()[-1] == "T5"
+                raise RuntimeError("boom")
+        assert mag.article_titles()[-1] == "T4"
+
+    # a magazine write invalidates topic areas, an author write does not
+    assert author.topic_areas() == ["Cat1"]
+    Author("Bob").save()
+    before = result_cache.stats()["hits"]
+    assert author.topic_areas() == ["Cat1"]
+    assert result_cache.stats()["hits"] == before + 1
+    mag.category = "Science"
+    mag.save()
+    assert author.topic_areas() == ["Science"]
+
+    stats = result_cache.stats()
+    assert stats["invalidations"] >= 4 and stats["bytes"] > 0 and 0 < stats["hit_rate"] < 1
+
+
+def test_save_skips_unchanged_and_writes_only_changed_columns(capsys):
+    from lib import instrumentation
+
+    author = Author("Alice")
+    author.save()
+    mag = Magazine("Mag One", "Cat1")
+    mag.save()
+    article = author.add_article("T1", mag)
+    Magazine.save_many([mag])
+    loaded = Article.find_by_id(article.id)
+    capsys.readouterr()
+
+    # saving without changes (or with the same value) does not touch the db
+    with instrumentation.capture() as stats:
+        author.save()
+        mag.category = "Cat1"
+        mag.save()
+        article.save()
+        loaded.save()
+        Magazine.save_many([mag])
+    assert stats.count == 0
+    assert capsys.readouterr().out == ""
+
+    # only the changed column is written
+    mag.category = "Science"
+    with instrumentation.capture() as stats:
+        mag.save()
+    updates = [q.sql for q in stats.queries if q.sql.startswith("UPDATE")]
+    assert updates == ["UPDATE magazines SET category=? WHERE id=?"]
+    assert Magazine.find_by_id(mag.id).category == "Science"
+    with instrumentation.capture() as stats:
+        mag.save()
+    assert stats.count == 0
+
+
+def test_write_queue_group_commits_concurrent_saves(capsys):
+    import sqlite3
+    import threading
+    from lib import writer
+    from lib.database_utils import session
+
+    author = Author("Alice")
+    author.save()
+    mag = Magazine("Mag One", "Cat1")
+    mag.save()
+    assert mag.article_titles() == []
+
+    queue = writer.enable_write_queue(max_batch=50, max_latency=0.01)
+    try:
+        articles = []
+        def worker(n):
+            for i in range(25):
+                articles.append(author.add_article(f"T{n}-{i}", mag))
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        # every caller got its own id back and the writes shared transactions
+        assert len({a.id for a in articles}) == 200 and None not in {a.id for a in articles}
+        stats = queue.stats()
+        assert stats["writes"] == 200 and stats["errors"] == 0
+        assert stats["batches"] < 200
+        # the committed writes invalidated the cached titles
+        assert len(mag.article_titles()) == 200
+
+        # a failing write only fails its own caller
+        future = queue.submit(("articles",), "INSERT INTO no_such_table VALUES (1)")
+        ok = queue.submit(("authors",), "INSERT INTO authors (name) VALUES (?)", ("Bob",))
+        with pytest.raises(sqlite3.OperationalError):
+            future.result()
+        assert Author.find_by_id(ok.result()).name == "Bob"
+
+        # inside a session writes stay on the session's own transaction
+        with session():
+            author.add_article("in session", mag)
+        assert mag.article_titles()[-1] == "in session"
+    finally:
+        writer.disable_write_queue()
+    assert writer.get_write_queue() is None
+    author.add_article("after", mag)
+    assert mag.article_titles()[-1] == "after"
+
+
+def test_parallel_reports_match_serial_and_model_results():
+    from lib import reports
+
+    authors = [Author(f"Author {i}") for i in range(12)]
+    Author.save_many(authors)
+    mags = [Magazine(f"Mag {i}", f"Cat{i % 4}") for i in range(9)]
+    Magazine.save_many(mags)
+    Article.bulk_create(
+        (f"T{i}", authors[i % 12].id, mags[(i * 7) % 9 if i % 4 else i % 2].id) for i in range(400)
+    )
+
+    serial = {name: reports.run_report(name, workers=1) for name in reports.REPORTS}
+    for name in reports.REPORTS:
+        assert reports.run_report(name, workers=2, ranges=5) == serial[name]
+
+    assert reports.contributing_authors(workers=1) == {
+        magazine_id: [(a.id, a.name) for a in found]
+        for magazine_id, found in Magazine.all_contributing_authors().items()
+    }
+    top = reports.top_magazines(limit=3, workers=1)
+    assert [row[3] for row in top] == sorted((len(found) for found in Magazine.all_contributors().values()), reverse=True)[:3]
+    reach = reports.cross_category_authors(workers=1)
+    assert reach
+    for author_id, name, categories in reach:
+        assert sorted(Author.find_by_id(author_id).topic_areas()) == categories
+
+    with pytest.raises(ValueError):
+        reports.run_report("nope")
+
+
+def test_columnar_snapshot_aggregates_match_models(tmp_path):
+    from lib.columnar import ArticleColumns
+
+    authors = [Author(f"Author {i}") for i in range(12)]
+    Author.save_many(authors)
+    mags = [Magazine(f"Mag {i}", f"Cat{i % 4}") for i in range(9)]
+    Magazine.save_many(mags)
+    Article.bulk_create(
+        (f"T{i}", authors[i % 12].id, mags[(i * 7) % 9 if i % 4 else i % 2].id) for i in range(400)
+    )
+
+    columns = ArticleColumns.snapshot(str(tmp_path / "snap"))
+    assert len(columns) == 400
+    assert columns.articles_per_magazine() == {m: n for m, n in Magazine.article_counts().items() if n}
+    assert columns.contributing_authors() == {
+        magazine_id: [a.id for a in found] for magazine_id, found in Magazine.all_contributing_authors().items()
+    }
+    assert columns.contributors_per_magazine() == {m: len(a) for m, a in Magazine.all_contributors().items()}
+    assert sum(columns.articles_per_author_magazine().values()) == 400
+    reach = columns.categories_per_author()
+    for author in authors:
+        assert reach[author.id] == len(author.topic_areas())
+    assert columns.authors_in_categories(2) == sorted(a.id for a in authors if len(a.topic_areas()) >= 2)
+
+    # the cached files are memory-mapped back while the db is unchanged and rebuilt after a write
+    cached = ArticleColumns.snapshot(str(tmp_path / "snap"))
+    assert cached.signature == columns.signature
+    assert list(cached.author_ids) == list(columns.author_ids)
+    assert cached.articles_per_author() == columns.articles_per_author()
+    mags[0].category = "Other"
+    mags[0].save()
+    refreshed = ArticleColumns.snapshot(str(tmp_path / "snap"))
+    assert "Other" in refreshed.categories and refreshed.signature != columns.signature
+
+    # moving articles to another author (save() and the bulk update path) also refreshes it
+    first = Article.find_by_id(1)
+    Article(first.title, authors[1], first.magazine, id=first.id).save()
+    moved = ArticleColumns.snapshot(str(tmp_path / "snap"))
+    assert moved.articles_per_author()[authors[1].id] == refreshed.articles_per_author()[authors[1].id] + 1
+    Article.bulk_create([Article(first.title, authors[2], first.magazine, id=first.id)])
+    assert ArticleColumns.snapshot(str(tmp_path / "snap")).articles_per_author() == ArticleColumns.from_db().articles_per_author()
+    assert ArticleColumns.snapshot(str(tmp_path / "snap")).articles_per_author()[authors[1].id] == refreshed.articles_per_author()[authors[1].id]
+
+
+def test_failed_writes_release_the_write_lock(capsys):
+    import sqlite3
+    from concurrent.futures import ThreadPoolExecutor
+
+    author = Author("Alice")
+    author.save()
+    mag = Magazine("Mag One", "Cat1")
+    mag.save()
+    ghost = Author._trusted(999, "ghost")
+
+    # foreign key violations on the direct and the bulk write paths
+    with pytest.raises(sqlite3.IntegrityError):
+        Article("x", ghost, mag).save()
+    assert not get_connection().in_transaction
+    with pytest.raises(sqlite3.IntegrityError):
+        Article.bulk_create([("y", 999, mag.id)])
+    assert not get_connection().in_transaction
+
+    # another thread can still write straight away
+    with ThreadPoolExecutor(1) as pool:
+        pool.submit(lambda: Author("Bob").save()).result()
+    assert Author.find_by_ids([author.id + 1])[0].name == "Bob"